@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+from functools import lru_cache
+from typing import Callable, Dict, List
+import tiktoken
+from ai_services.cache import TTLCache
+from ai_services.openai_client import get_openai_client
+from ai_services.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Prompt tokens (system prompt + health context + history) allowed before older turns are compacted
+CHAT_TOKEN_BUDGET = int(os.getenv('CHAT_TOKEN_BUDGET', '3000'))
+# Most recent messages that are always sent verbatim
+CHAT_KEEP_TURNS = int(os.getenv('CHAT_KEEP_TURNS', '6'))
+CHAT_SUMMARY_MODEL = os.getenv('CHAT_SUMMARY_MODEL', 'gpt-3.5-turbo')
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv('CHAT_SUMMARY_MAX_TOKENS', '300'))
+
+# Every chat message costs a few tokens of framing on top of its content
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+SUMMARY_PROMPT = """Summarize the conversation below between a user and a health assistant.
+Keep every health fact, symptom, measurement, medication and piece of advice that was given,
+and drop small talk. Write at most a short paragraph."""
+
+# Formatted health context per user, keyed on a hash of the user data
+health_context_cache = TTLCache(
+    maxsize=int(os.getenv('CHAT_CONTEXT_CACHE_SIZE', '4096')),
+    ttl=float(os.getenv('CHAT_CONTEXT_CACHE_TTL', '3600'))
+)
+# Rolling summaries keyed on a hash chain over the summarized messages
+summary_cache = TTLCache(
+    maxsize=int(os.getenv('CHAT_SUMMARY_CACHE_SIZE', '4096')),
+    ttl=float(os.getenv('CHAT_SUMMARY_CACHE_TTL', '86400'))
+)
+
+@lru_cache(maxsize=None)
+def _encoding(model: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+def count_tokens(text: str, model: str = 'gpt-4') -> int:
+    return len(_encoding(model).encode(text))
+
+def count_message_tokens(messages: List[Dict], model: str = 'gpt-4') -> int:
+    return sum(TOKENS_PER_MESSAGE + count_tokens(m["content"], model) for m in messages) + TOKENS_PER_REPLY
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def cached_health_context(user_data: Dict, build: Callable[[Dict], str]) -> str:
+    """Format the user's health context once and reuse it while the data is unchanged."""
+    payload = json.dumps(user_data, sort_keys=True, default=str).encode()
+    key = f"{build.__qualname__}:{_digest(payload)}"
+    context = health_context_cache.get(key)
+    if context is None:
+        context = build(user_data)
+        health_context_cache.set(key, context)
+    return context
+
+def _prefix_keys(messages: List[Dict]) -> List[str]:
+    """keys[i] identifies messages[:i + 1], so a growing history reuses earlier summaries."""
+    keys, key = [], ""
+    for m in messages:
+        key = _digest(f"{key}\0{m['role']}\0{m['content']}".encode())
+        keys.append(key)
+    return keys
+
+class TokenBudget:
+    """Keeps chat prompts under a token budget.
+
+    Under the budget the history is sent as is. Over it, the last `keep_turns`
+    messages stay verbatim and everything before them is replaced by a rolling
+    summary; the summary is cached so each turn only summarizes what is new.
+    """
+
+    def __init__(self, budget: int = CHAT_TOKEN_BUDGET, keep_turns: int = CHAT_KEEP_TURNS,
+                 summary_model: str = CHAT_SUMMARY_MODEL):
+        self.budget = budget
+        self.keep_turns = keep_turns
+        self.summary_model = summary_model
+        self.compactions = 0
+        self.summaries = 0
+
+    async def fit(self, system: List[Dict], history: List[Dict], model: str = 'gpt-4') -> List[Dict]:
+        """Return the messages to send: system messages, optional summary, then recent history."""
+        if count_message_tokens(system + history, model) <= self.budget or len(history) <= self.keep_turns:
+            return system + history
+
+        self.compactions += 1
+        older, recent = history[:-self.keep_turns], history[-self.keep_turns:]
+        summary = await self._summarize(older)
+        if summary:
+            system = system + [{"role": "system", "content": f"Summary of the earlier conversation: {summary}"}]
+
+        # Still over budget: drop the oldest kept turns, but always keep the latest message
+        while len(recent) > 1 and count_message_tokens(system + recent, model) > self.budget:
+            recent = recent[1:]
+        return system + recent
+
+    async def _summarize(self, messages: List[Dict]) -> str | None:
+        keys = _prefix_keys(messages)
+        summary = summary_cache.get(keys[-1])
+        if summary is not None:
+            return summary
+
+        # Extend the longest already-summarized prefix instead of starting over
+        start, previous = 0, None
+        for i in range(len(keys) - 2, -1, -1):
+            previous = summary_cache.get(keys[i])
+            if previous is not None:
+                start = i + 1
+                break
+
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages[start:])
+        if previous:
+            transcript = f"Summary so far: {previous}\n\n{transcript}"
+        try:
+            with stage("chat.summarize_history"):
+                response = await get_openai_client().chat.completions.create(
+                    model=self.summary_model,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {"role": "user", "content": transcript}
+                    ],
+                    temperature=0.0,
+                    max_tokens=CHAT_SUMMARY_MAX_TOKENS
+                )
+        except Exception as e:
+            # Better to answer without the old turns than not at all
+            logger.warning(f"Failed to summarize chat history: {str(e)}")
+            return previous
+
+        summary = response.choices[0].message.content.strip()
+        summary_cache.set(keys[-1], summary)
+        self.summaries += 1
+        return summary
+
+    def stats(self) -> Dict:
+        return {
+            "budget": self.budget,
+            "keep_turns": self.keep_turns,
+            "compactions": self.compactions,
+            "summaries": self.summaries,
+            "summary_cache": summary_cache.stats(),
+            "health_context_cache": health_context_cache.stats()
+        }
+
+token_budget = TokenBudget()
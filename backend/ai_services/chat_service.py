@@ -1,7 +1,10 @@
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
 from pydantic import BaseModel
-from openai import OpenAI
-import os
+from ai_services.openai_client import get_openai_client
+from ai_services.chat_context import cached_health_context, token_budget
+import logging
+
+logger = logging.getLogger(__name__)
 
 class Message(BaseModel):
     role: str
@@ -19,45 +22,69 @@ class ChatRequest(BaseModel):
 
 class ChatService:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.model = "gpt-4-turbo-preview"  # or another appropriate model
         self.system_prompt = """You are a knowledgeable and empathetic health assistant. 
         Your role is to provide accurate health information, guidance, and support while being mindful of medical ethics.
         Always encourage users to consult healthcare professionals for specific medical advice, diagnosis, or treatment.
         Use the provided user health data to give more personalized responses when available."""
 
+    def _format_user_context(self, user_data: Dict) -> str:
+        return f"""User Profile:
+            Age: {user_data.get('age') or 'Not provided'}
+            Gender: {user_data.get('gender') or 'Not provided'}
+            Health Conditions: {', '.join(user_data['health_conditions']) if user_data.get('health_conditions') else 'None reported'}
+            Recent Metrics: {user_data.get('recent_metrics') or 'Not available'}
+            """
+
+    async def _build_messages(self, chat_request: ChatRequest) -> List[Dict]:
+        # Format user data if available; reused across turns while it is unchanged
+        context = ""
+        if chat_request.user_data:
+            context = cached_health_context(chat_request.user_data.dict(), self._format_user_context)
+
+        # Prepare messages for OpenAI, compacting older turns to fit the token budget
+        system = [{"role": "system", "content": self.system_prompt + "\n" + context}]
+        history = [{"role": msg.role, "content": msg.content} for msg in chat_request.messages]
+        return await token_budget.fit(system, history, self.model)
+
+    async def _completion_args(self, chat_request: ChatRequest) -> Dict:
+        return dict(
+            model=self.model,
+            messages=await self._build_messages(chat_request),
+            temperature=0.7,
+            max_tokens=500,
+            top_p=1.0,
+            frequency_penalty=0.0,
+            presence_penalty=0.0
+        )
+
     async def get_response(self, chat_request: ChatRequest) -> str:
         try:
-            # Format user data if available
-            context = ""
-            if chat_request.user_data:
-                context = f"""User Profile:
-                Age: {chat_request.user_data.age if chat_request.user_data.age else 'Not provided'}
-                Gender: {chat_request.user_data.gender if chat_request.user_data.gender else 'Not provided'}
-                Health Conditions: {', '.join(chat_request.user_data.health_conditions) if chat_request.user_data.health_conditions else 'None reported'}
-                Recent Metrics: {chat_request.user_data.recent_metrics if chat_request.user_data.recent_metrics else 'Not available'}
-                """
-
-            # Prepare messages for OpenAI
-            messages = [
-                {"role": "system", "content": self.system_prompt + "\n" + context},
-                *[{"role": msg.role, "content": msg.content} for msg in chat_request.messages]
-            ]
-
             # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo-preview",  # or another appropriate model
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0
-            )
+            response = await get_openai_client().chat.completions.create(**await self._completion_args(chat_request))
 
             return response.choices[0].message.content
 
         except Exception as e:
-            print(f"Error in chat service: {str(e)}")
+            logger.error(f"Error in chat service: {str(e)}")
             raise Exception("Failed to generate response. Please try again later.")
 
+    async def stream_response(self, chat_request: ChatRequest) -> AsyncIterator[str]:
+        """Yield the reply as content deltas arrive; closing the generator aborts the request."""
+        try:
+            stream = await get_openai_client().chat.completions.create(
+                stream=True, **await self._completion_args(chat_request)
+            )
+        except Exception as e:
+            logger.error(f"Error in chat service: {str(e)}")
+            raise Exception("Failed to generate response. Please try again later.")
+
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Drop the upstream connection if our client went away mid-stream
+            await stream.response.aclose()
+
 chat_service = ChatService()
\ No newline at end of file
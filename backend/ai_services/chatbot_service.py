@@ -1,14 +1,18 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Optional
-import openai
-import os
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+import logging
+import numpy as np
 from dotenv import load_dotenv
+from ai_services.openai_client import get_openai_client
+from ai_services.chat_context import cached_health_context, token_budget
+from ai_services.metrics import observe_stage, stage
+from ai_services.semantic_cache import semantic_cache
+import time
 
 load_dotenv()
 
-# Set OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
 
 class Message(BaseModel):
     role: str
@@ -20,48 +24,123 @@ class ChatInput(BaseModel):
 
 class ChatbotService:
     def __init__(self):
+        self.model = "gpt-4"
         self.system_prompt = """You are a knowledgeable healthcare assistant. Use the provided user health data 
         to give personalized advice. Always maintain a professional and empathetic tone. If you're unsure about 
         anything, recommend consulting a healthcare provider."""
     
+    async def _build_messages(self, chat_input: ChatInput) -> List[Dict]:
+        # Prepare messages with system prompt and user health context
+        system = [{"role": "system", "content": self.system_prompt}]
+        
+        # Add user health context if available, formatted once per distinct user data
+        if chat_input.user_data:
+            health_context = cached_health_context(chat_input.user_data, self._format_health_context)
+            system.append({
+                "role": "system",
+                "content": f"User health context: {health_context}"
+            })
+        
+        # Add conversation history, compacted to fit the token budget
+        history = [{"role": msg.role, "content": msg.content} for msg in chat_input.messages]
+        return await token_budget.fit(system, history, self.model)
+
+    async def _completion_args(self, chat_input: ChatInput) -> Dict:
+        return dict(
+            model=self.model,
+            messages=await self._build_messages(chat_input),
+            temperature=0.7,
+            max_tokens=500,
+            top_p=0.9,
+            frequency_penalty=0.5,
+            presence_penalty=0.5
+        )
+
+    def _cacheable_question(self, chat_input: ChatInput) -> str | None:
+        """The question text if the answer can be shared between users, else None.
+
+        Only an opening question without personal health data qualifies; anything
+        later in a conversation depends on what was said before.
+        """
+        if chat_input.user_data:
+            return None
+        user_messages = [msg for msg in chat_input.messages if msg.role == "user"]
+        if len(user_messages) != 1 or chat_input.messages[-1].role != "user":
+            return None
+        return user_messages[0].content
+
+    async def _cached_answer(self, chat_input: ChatInput) -> Tuple[str | None, np.ndarray | None]:
+        """(cached answer, embedding to store the new answer under); a broken cache is skipped."""
+        question = self._cacheable_question(chat_input)
+        if question is None:
+            return None, None
+        try:
+            return await semantic_cache.lookup(question)
+        except Exception as e:
+            logger.error(f"Semantic cache lookup failed: {str(e)}")
+            return None, None
+
+    def _cache_answer(self, vector: np.ndarray | None, answer: str):
+        if vector is None or not answer:
+            return
+        try:
+            semantic_cache.set(vector, answer)
+        except Exception as e:
+            logger.error(f"Failed to cache chat answer: {str(e)}")
+
     async def get_response(self, chat_input: ChatInput) -> Dict:
+        answer, vector = await self._cached_answer(chat_input)
+        if answer is not None:
+            return {"response": answer, "usage": None, "cached": True}
+
         try:
-            # Prepare messages with system prompt and user health context
-            messages = [{"role": "system", "content": self.system_prompt}]
-            
-            # Add user health context if available
-            if chat_input.user_data:
-                health_context = self._format_health_context(chat_input.user_data)
-                messages.append({
-                    "role": "system",
-                    "content": f"User health context: {health_context}"
-                })
-            
-            # Add conversation history
-            for msg in chat_input.messages:
-                messages.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
-            
             # Get response from GPT-4
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500,
-                top_p=0.9,
-                frequency_penalty=0.5,
-                presence_penalty=0.5
-            )
+            args = await self._completion_args(chat_input)
+            with stage("chat.completion"):
+                response = await get_openai_client().chat.completions.create(**args)
             
+            answer = response.choices[0].message.content
+            self._cache_answer(vector, answer)
             return {
-                "response": response.choices[0].message.content,
-                "usage": response.usage
+                "response": answer,
+                "usage": response.usage,
+                "cached": False
             }
         
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+
+    async def stream_response(self, chat_input: ChatInput) -> AsyncIterator[str]:
+        """Yield the reply as content deltas arrive; closing the generator aborts the request.
+
+        A cached answer is yielded whole.
+        """
+        answer, vector = await self._cached_answer(chat_input)
+        if answer is not None:
+            yield answer
+            return
+
+        try:
+            args = await self._completion_args(chat_input)
+            start = time.perf_counter()
+            stream = await get_openai_client().chat.completions.create(stream=True, **args)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        pieces = []
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not pieces:
+                        observe_stage("chat.first_token", time.perf_counter() - start)
+                    pieces.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Drop the upstream connection if our client went away mid-stream
+            await stream.response.aclose()
+
+        # Only a reply that streamed to the end is worth reusing
+        self._cache_answer(vector, "".join(pieces))
     
     def _format_health_context(self, user_data: Dict) -> str:
         """Format user health data into a readable context string."""
@@ -0,0 +1,178 @@
+"""Score CSV or Parquet cohort extracts offline.
+
+Run from the backend directory:
+
+    python -m ai_services.cohort_scoring cohort.parquet scores.parquet --workers 8
+    python -m ai_services.cohort_scoring cohort.csv scores.csv --id-columns patient_id
+
+The input is read in chunks straight into float32 feature matrices, without
+building a HealthMetrics object per row. Worker processes run the XGBoost and
+TFLite models over each chunk and evaluate the recommendation rules on whole
+columns. Results are written in input order as chunks finish. At most
+2 x --workers chunks are in flight, so memory use does not grow with the
+input size. Rows with a missing or unparseable field get empty scores.
+"""
+import argparse
+import logging
+import multiprocessing
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from ai_services.risk_prediction_service import FEATURE_FIELDS, RISK_CATEGORIES, RiskPrediction, recommendation_rules
+from ai_services.model_versions import model_versions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 65536
+# Rough size of one CSV row, to turn --chunk-rows into a read block size
+CSV_BYTES_PER_ROW = 96
+
+# Loaded once per worker process
+_worker_predictor: RiskPrediction | None = None
+
+def _init_worker(version: str | None):
+    global _worker_predictor
+    _worker_predictor = model_versions.load(version) if version else model_versions.ensure_active().get()
+
+def _score_chunk(features: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Risk scores (N x 4), health scores (N) and rule matches (N x rules) for complete rows."""
+    if not len(features):
+        return (np.empty((0, len(RISK_CATEGORIES)), dtype=np.int16), np.empty(0, dtype=np.int16),
+                np.empty((0, len(recommendation_rules.rules)), dtype=bool))
+    risk = _worker_predictor.normalize_scores(_worker_predictor.run_models(features))
+    health = (100 - risk.mean(axis=1)).astype(np.int16)
+    matches = recommendation_rules.match_matrix({field: features[:, j] for j, field in enumerate(FEATURE_FIELDS)})
+    return risk, health, matches
+
+def read_chunks(path: str, chunk_rows: int, id_columns: List[str]) -> Iterator[pa.RecordBatch]:
+    columns = list(FEATURE_FIELDS) + id_columns
+    if path.endswith('.parquet'):
+        yield from pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns)
+        return
+    column_types = {field: pa.float32() for field in FEATURE_FIELDS}
+    column_types.update(gender=pa.string(), smoking=pa.bool_())
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(block_size=chunk_rows * CSV_BYTES_PER_ROW),
+        convert_options=pa_csv.ConvertOptions(include_columns=columns, column_types=column_types)
+    )
+    yield from reader
+
+def to_features(batch: pa.RecordBatch) -> Tuple[np.ndarray, np.ndarray]:
+    """N x 12 float32 features in the models' column order, and a mask of complete rows."""
+    features = np.empty((batch.num_rows, len(FEATURE_FIELDS)), dtype=np.float32)
+    for j, field in enumerate(FEATURE_FIELDS):
+        column = batch.column(field)
+        if field == 'gender':
+            column = pc.equal(pc.utf8_lower(column), 'male')
+        # Nulls become NaN and mark the row incomplete
+        features[:, j] = column.cast(pa.float32()).to_numpy(zero_copy_only=False)
+    return features, np.isfinite(features).all(axis=1)
+
+def recommendation_ids(matches: np.ndarray) -> np.ndarray:
+    """';'-joined ids of the matching rules per row, built once per distinct combination."""
+    rule_ids = [rule.id for rule in recommendation_rules.rules]
+    masks = matches.astype(np.int64) @ (1 << np.arange(len(rule_ids), dtype=np.int64))
+    combinations, inverse = np.unique(masks, return_inverse=True)
+    labels = np.array(
+        [";".join(rule_id for j, rule_id in enumerate(rule_ids) if mask >> j & 1) for mask in combinations],
+        dtype=object
+    )
+    return labels[inverse]
+
+def output_batch(batch: pa.RecordBatch, valid: np.ndarray, scored: Tuple, id_columns: List[str]) -> pa.RecordBatch:
+    risk, health, matches = scored
+
+    def scatter(values: np.ndarray) -> pa.Array:
+        full = np.zeros(len(valid), dtype=values.dtype)
+        full[valid] = values
+        return pa.array(full, mask=~valid)
+
+    names = list(id_columns) + ['health_score'] + list(RISK_CATEGORIES) + ['recommendations']
+    arrays = [batch.column(name) for name in id_columns] + [scatter(health)]
+    arrays += [scatter(risk[:, j]) for j in range(len(RISK_CATEGORIES))]
+    ids = np.full(len(valid), None, dtype=object)
+    ids[valid] = recommendation_ids(matches)
+    arrays.append(pa.array(ids, type=pa.string()))
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+class CohortWriter:
+    """Writes output batches to CSV or Parquet, opened with the first batch's schema."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = None
+
+    def write(self, batch: pa.RecordBatch):
+        if self._writer is None:
+            if self.path.endswith('.parquet'):
+                self._writer = pq.ParquetWriter(self.path, batch.schema)
+            else:
+                self._writer = pa_csv.CSVWriter(self.path, batch.schema)
+        self._writer.write_table(pa.Table.from_batches([batch]))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+def score_file(input_path: str, output_path: str, workers: int = 4, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+               id_columns: List[str] | None = None, version: str | None = None) -> Dict:
+    id_columns = list(id_columns or [])
+    rows = incomplete = 0
+    start = time.perf_counter()
+    in_flight: "deque[Tuple[pa.RecordBatch, np.ndarray, Future]]" = deque()
+    writer = CohortWriter(output_path)
+
+    def write_oldest():
+        nonlocal rows, incomplete
+        batch, valid, future = in_flight.popleft()
+        writer.write(output_batch(batch, valid, future.result(), id_columns))
+        rows += len(valid)
+        incomplete += int((~valid).sum())
+        logger.info(f"{rows} rows scored, {rows / (time.perf_counter() - start):.0f} rows/s")
+
+    # Spawn rather than fork: TensorFlow and XGBoost threads don't survive fork
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(version,)) as pool:
+        try:
+            for batch in read_chunks(input_path, chunk_rows, id_columns):
+                features, valid = to_features(batch)
+                in_flight.append((batch, valid, pool.submit(_score_chunk, features[valid])))
+                if len(in_flight) >= 2 * workers:
+                    write_oldest()
+            while in_flight:
+                write_oldest()
+        finally:
+            writer.close()
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "incomplete_rows": incomplete,
+        "seconds": round(seconds, 2),
+        "rows_per_second": round(rows / seconds, 1) if seconds else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet cohort extract")
+    parser.add_argument("input", help="CSV or .parquet file with one HealthMetrics field per column")
+    parser.add_argument("output", help="CSV or .parquet file to write scores to")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--id-columns", nargs="*", default=[], help="input columns copied to the output")
+    parser.add_argument("--model-version", help="risk model version (default: newest)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stats = score_file(args.input, args.output, args.workers, args.chunk_rows, args.id_columns, args.model_version)
+    print(stats, file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from typing import List, Dict, Set, Tuple
+from ai_services.risk_prediction_service import HealthMetrics
+from ai_services.model_versions import get_risk_predictor, model_versions
+from ai_services.model_client import get_model_client
+
+# 'thread' shares one RiskPrediction (one interpreter per thread),
+# 'process' loads every version in each worker process and nothing in the API process.
+# With a model server, threads forward to it and nothing is loaded here.
+INFERENCE_MODE = os.getenv('INFERENCE_MODE', 'thread')
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '4'))
+# Predictions (not batches) allowed to wait for a free worker before we answer 503;
+# a batch larger than this is still run when nothing else is pending
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', '256'))
+
+class QueueFullError(Exception):
+    """Raised when the inference queue has no room for another request."""
+
+# Longest a worker waits for the others to pick up their preload task
+PRELOAD_TIMEOUT_SECONDS = 600
+
+# Shared by the pool's workers so a preload reaches each of them exactly once
+_worker_barrier = None
+
+def _init_process_worker(barrier):
+    global _worker_barrier
+    _worker_barrier = barrier
+
+def _preload_in_process(version: str | None, keep: Set[str]) -> int:
+    # A worker holding a preload task can't take another until every worker has one
+    _worker_barrier.wait(PRELOAD_TIMEOUT_SECONDS)
+    if version is not None:
+        model_versions.load(version)
+    model_versions.retain(keep)
+    return os.getpid()
+
+def _score_in_process(metrics_list: List[HealthMetrics], version: str | None) -> List[Dict]:
+    if version is None:
+        # Nothing has been activated by the API process yet
+        return model_versions.ensure_active().get().score_batch(metrics_list)
+    # Preloaded before the version got any traffic; loads here only if this worker missed that
+    return model_versions.load(version).score_batch(metrics_list)
+
+def _init_thread_worker():
+    if get_model_client() is not None:
+        return
+    # Load the shared models once and give this thread its own interpreter
+    get_risk_predictor().get_interpreter()
+
+def _score_in_thread(metrics_list: List[HealthMetrics], version: str | None) -> List[Dict]:
+    client = get_model_client()
+    if client is not None:
+        return client.call("risk.score", metrics_list, version)
+    return get_risk_predictor(version).score_batch(metrics_list)
+
+def _ping():
+    return os.getpid()
+
+class InferenceExecutor:
+    def __init__(self, mode: str = INFERENCE_MODE, workers: int = INFERENCE_WORKERS,
+                 queue_size: int = INFERENCE_QUEUE_SIZE):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Unknown inference mode: {mode}")
+        if get_model_client() is not None:
+            # Worker processes would only relay to the model server
+            mode = 'thread'
+        self.mode = mode
+        self.workers = workers
+        self.queue_size = queue_size
+        # Running plus waiting predictions (not batches); only touched from the event loop
+        self.pending = 0
+
+        if mode == 'process':
+            # Spawn rather than fork: TensorFlow and XGBoost threads don't survive fork
+            context = multiprocessing.get_context('spawn')
+            self._barrier = context.Barrier(workers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=context,
+                initializer=_init_process_worker,
+                initargs=(self._barrier,)
+            )
+            self._fn = _score_in_process
+            # The workers hold the models; this process only routes
+            model_versions.delegate_loading(self._preload)
+        else:
+            self._pool = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix='inference',
+                initializer=_init_thread_worker
+            )
+            self._fn = _score_in_thread
+        self.warmed = False
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    def _preload(self, version: str | None, keep: Set[str]):
+        """Load and warm `version` in every worker, dropping versions not in `keep`; blocks until all are done."""
+        futures = [self._pool.submit(_preload_in_process, version, keep) for _ in range(self.workers)]
+        wait(futures)
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if any(isinstance(e, threading.BrokenBarrierError) for e in errors):
+            self._barrier.reset()
+        if errors:
+            raise errors[0]
+
+    async def warm(self):
+        """Start every worker up front so the first requests don't pay model loading."""
+        if self.mode == 'process':
+            await asyncio.to_thread(model_versions.ensure_active)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self._pool, _ping) for _ in range(self.workers)])
+        self.warmed = True
+
+    async def predict_batch(self, metrics_list: List[HealthMetrics], version: str | None = None) -> List[Dict]:
+        """Score on `version`, or the active version if None; each result records its model_version."""
+        size = len(metrics_list)
+        if self.pending and self.pending + size > self.capacity:
+            raise QueueFullError("Inference queue is full")
+        self.pending += size
+        loop = asyncio.get_running_loop()
+        future = self._pool.submit(self._fn, metrics_list, version)
+
+        def release():
+            self.pending -= size
+
+        # Released when the worker is done with it, not when the caller stops waiting
+        # (a cancelled caller leaves a running job behind)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(release))
+        return await asyncio.wrap_future(future)
+
+    async def predict(self, metrics: HealthMetrics, version: str | None = None) -> Dict:
+        return (await self.predict_batch([metrics], version))[0]
+
+    async def predict_versioned(self, items: List[Tuple[HealthMetrics, str | None]]) -> List[Dict]:
+        """Score (metrics, version) pairs with one batch per version, in input order."""
+        groups: Dict[str | None, List[int]] = {}
+        for i, (_, version) in enumerate(items):
+            groups.setdefault(version, []).append(i)
+        scored = await asyncio.gather(*[
+            self.predict_batch([items[i][0] for i in indices], version) for version, indices in groups.items()
+        ])
+        results = [None] * len(items)
+        for indices, group_results in zip(groups.values(), scored):
+            for i, result in zip(indices, group_results):
+                results[i] = result
+        return results
+
+    def stats(self) -> Dict:
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'pending': self.pending,
+            'warmed': self.warmed
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,409 @@
+"""Storage and scheduling for background jobs (see ai_services.jobs).
+
+A broker persists jobs and hands them to workers: highest priority first,
+oldest first within a priority. A claimed job is leased to one worker. If
+the worker dies and the lease runs out, another worker claims the job again
+as its next attempt. Identical submissions (same kind and payload) return
+the job that is already queued, running or recently finished.
+
+JOBS_BROKER_URL picks the implementation. The default is SQLite
+(sqlite:///data/jobs.db), which needs no extra services and is shared by the
+API and any number of worker processes on the same host. memory:// keeps
+jobs in this process only, for a single API process running its own
+workers, or for tests; they are lost on restart. Other brokers plug in with
+register_broker().
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+JOBS_BROKER_URL = os.getenv('JOBS_BROKER_URL', 'sqlite:///data/jobs.db')
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# A worker that has not renewed its lease for this long is presumed dead
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))
+# How long a finished job is handed back for an identical submission
+JOB_DEDUP_SECONDS = float(os.getenv('JOB_DEDUP_SECONDS', '3600'))
+# Finished jobs older than this are deleted
+JOB_RETENTION_SECONDS = float(os.getenv('JOB_RETENTION_SECONDS', '86400'))
+
+# Lower runs first
+PRIORITIES = {"interactive": 0, "batch": 10}
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+class Broker(ABC):
+    """Interface every broker implements; job dicts never include the payload."""
+
+    @abstractmethod
+    def submit(self, kind: str, payload: Dict, priority: int, dedup_key: str | None = None,
+               max_attempts: int = JOB_MAX_ATTEMPTS) -> Tuple[Dict, bool]:
+        """Queue a job; returns (job, created), where created is False for a duplicate."""
+
+    @abstractmethod
+    def claim(self, worker: str, kinds: List[str] | None = None,
+              lease_seconds: float = JOB_LEASE_SECONDS) -> Tuple[Dict, Dict] | None:
+        """Lease the next runnable job to `worker`; returns (job, payload) or None."""
+
+    @abstractmethod
+    def renew(self, job_id: str, worker: str, lease_seconds: float = JOB_LEASE_SECONDS,
+              progress: Dict | None = None) -> bool:
+        """Extend a lease (optionally recording progress); False if the worker lost the job."""
+
+    @abstractmethod
+    def complete(self, job_id: str, worker: str, result) -> bool:
+        """Store the result and drop the payload; False if the worker lost the job."""
+
+    @abstractmethod
+    def fail(self, job_id: str, worker: str, error: str, retry_in: float | None) -> bool:
+        """Record a failed attempt, requeued after `retry_in` seconds unless None or out of attempts."""
+
+    @abstractmethod
+    def get(self, job_id: str, include_result: bool = True) -> Dict | None:
+        """The job, with its result unless include_result is False; None if unknown."""
+
+    @abstractmethod
+    def purge(self, older_than: float = JOB_RETENTION_SECONDS) -> int:
+        """Delete jobs that finished more than `older_than` seconds ago; returns how many."""
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        """Job counts by kind and status."""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    dedup_key TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    worker TEXT,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_runnable ON jobs (status, priority, created_at);
+CREATE INDEX IF NOT EXISTS ix_jobs_dedup_key ON jobs (dedup_key);
+"""
+
+JOB_COLUMNS = ("id, kind, priority, status, attempts, max_attempts, worker, progress, error, "
+               "created_at, started_at, finished_at, updated_at")
+
+class SQLiteBroker(Broker):
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # sqlite3 connections can't be shared across threads, so each thread opens its own
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit; transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # WAL lets the API read job status while workers write
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn: Callable[[sqlite3.Connection], object]):
+        # IMMEDIATE takes the write lock up front, so two workers can't claim the same job
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            value = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return value
+
+    @staticmethod
+    def _job(row: sqlite3.Row, include_result: bool = False) -> Dict:
+        job = {key: row[key] for key in row.keys() if key not in ('progress', 'result')}
+        job["progress"] = json.loads(row["progress"]) if row["progress"] else None
+        if include_result:
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
+
+    def submit(self, kind, payload, priority, dedup_key=None, max_attempts=JOB_MAX_ATTEMPTS):
+        now = time.time()
+
+        def run(conn):
+            if dedup_key is not None:
+                row = conn.execute(
+                    f"SELECT {JOB_COLUMNS} FROM jobs WHERE dedup_key = ? "
+                    "AND (status IN (?, ?) OR (status = ? AND finished_at > ?)) "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (dedup_key, QUEUED, RUNNING, SUCCEEDED, now - JOB_DEDUP_SECONDS)
+                ).fetchone()
+                if row is not None:
+                    return self._job(row), False
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, priority, status, dedup_key, max_attempts, "
+                "available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), priority, QUEUED, dedup_key, max_attempts, now, now, now)
+            )
+            row = conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._job(row), True
+
+        return self._transaction(run)
+
+    def claim(self, worker, kinds=None, lease_seconds=JOB_LEASE_SECONDS):
+        now = time.time()
+        kind_filter, kind_args = "", ()
+        if kinds:
+            kind_filter = f" AND kind IN ({', '.join('?' * len(kinds))})"
+            kind_args = tuple(kinds)
+
+        def run(conn):
+            # Jobs whose worker disappeared on the last attempt are not coming back
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = 'worker lost', finished_at = ?, updated_at = ? "
+                "WHERE status = ? AND lease_until < ? AND attempts >= max_attempts",
+                (FAILED, now, now, RUNNING, now)
+            )
+            row = conn.execute(
+                "SELECT id, payload FROM jobs "
+                "WHERE ((status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?))"
+                f"{kind_filter} ORDER BY priority, created_at LIMIT 1",
+                (QUEUED, now, RUNNING, now) + kind_args
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, worker = ?, lease_until = ?, "
+                "started_at = ?, progress = NULL, updated_at = ? WHERE id = ?",
+                (RUNNING, worker, now + lease_seconds, now, now, row["id"])
+            )
+            job = conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            return self._job(job), json.loads(row["payload"])
+
+        return self._transaction(run)
+
+    def _update_owned(self, job_id: str, worker: str, assignments: str, args: tuple) -> bool:
+        # Only the worker holding the lease may change a running job
+        def run(conn):
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                args + (time.time(), job_id, worker, RUNNING)
+            )
+            return cursor.rowcount == 1
+        return self._transaction(run)
+
+    def renew(self, job_id, worker, lease_seconds=JOB_LEASE_SECONDS, progress=None):
+        if progress is None:
+            return self._update_owned(job_id, worker, "lease_until = ?", (time.time() + lease_seconds,))
+        return self._update_owned(job_id, worker, "lease_until = ?, progress = ?",
+                                  (time.time() + lease_seconds, json.dumps(progress)))
+
+    def complete(self, job_id, worker, result):
+        # The payload (possibly whole uploaded files) is no longer needed
+        return self._update_owned(
+            job_id, worker, "status = ?, result = ?, error = NULL, payload = NULL, finished_at = ?, lease_until = NULL",
+            (SUCCEEDED, json.dumps(result), time.time())
+        )
+
+    def fail(self, job_id, worker, error, retry_in):
+        now = time.time()
+
+        def run(conn):
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker = ? AND status = ?",
+                (job_id, worker, RUNNING)
+            ).fetchone()
+            if row is None:
+                return False
+            if retry_in is not None and row["attempts"] < row["max_attempts"]:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, available_at = ?, lease_until = NULL, "
+                    "updated_at = ? WHERE id = ?",
+                    (QUEUED, error, now + retry_in, now, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL, "
+                    "updated_at = ? WHERE id = ?",
+                    (FAILED, error, now, now, job_id)
+                )
+            return True
+
+        return self._transaction(run)
+
+    def get(self, job_id, include_result=True):
+        columns = JOB_COLUMNS + (", result" if include_result else "")
+        row = self._connect().execute(f"SELECT {columns} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else self._job(row, include_result)
+
+    def purge(self, older_than=JOB_RETENTION_SECONDS):
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+            FINISHED + (time.time() - older_than,)
+        )
+        return cursor.rowcount
+
+    def stats(self):
+        rows = self._connect().execute(
+            "SELECT kind, status, COUNT(*) AS jobs FROM jobs GROUP BY kind, status"
+        ).fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            counts.setdefault(row["kind"], {})[row["status"]] = row["jobs"]
+        return {"broker": "sqlite", "path": self.path, "jobs": counts}
+
+class MemoryBroker(Broker):
+    """Same scheduling as SQLiteBroker, kept in a dict; visible to this process only.
+
+    Payloads, progress and results are stored as JSON, as SQLite stores them,
+    so callers get copies and anything unserializable fails on submit.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict] = {}  # insertion order breaks created_at ties
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _job(record: Dict, include_result: bool = False) -> Dict:
+        job = {key: record[key] for key in JOB_COLUMNS.split(', ') if key != 'progress'}
+        job["progress"] = json.loads(record["progress"]) if record["progress"] else None
+        if include_result:
+            job["result"] = json.loads(record["result"]) if record["result"] else None
+        return job
+
+    def submit(self, kind, payload, priority, dedup_key=None, max_attempts=JOB_MAX_ATTEMPTS):
+        now = time.time()
+        with self._lock:
+            if dedup_key is not None:
+                matches = [r for r in self._jobs.values() if r["dedup_key"] == dedup_key and (
+                    r["status"] in (QUEUED, RUNNING)
+                    or (r["status"] == SUCCEEDED and r["finished_at"] > now - JOB_DEDUP_SECONDS))]
+                if matches:
+                    return self._job(max(matches, key=lambda r: r["created_at"])), False
+            record = {
+                "id": uuid.uuid4().hex, "kind": kind, "payload": json.dumps(payload), "priority": priority,
+                "status": QUEUED, "dedup_key": dedup_key, "attempts": 0, "max_attempts": max_attempts,
+                "available_at": now, "lease_until": None, "worker": None, "progress": None, "result": None,
+                "error": None, "created_at": now, "started_at": None, "finished_at": None, "updated_at": now
+            }
+            self._jobs[record["id"]] = record
+            return self._job(record), True
+
+    def claim(self, worker, kinds=None, lease_seconds=JOB_LEASE_SECONDS):
+        now = time.time()
+        with self._lock:
+            runnable = []
+            for record in self._jobs.values():
+                expired = record["status"] == RUNNING and record["lease_until"] < now
+                # Jobs whose worker disappeared on the last attempt are not coming back
+                if expired and record["attempts"] >= record["max_attempts"]:
+                    record.update(status=FAILED, error='worker lost', finished_at=now, updated_at=now)
+                    continue
+                if (expired or (record["status"] == QUEUED and record["available_at"] <= now)) \
+                        and (not kinds or record["kind"] in kinds):
+                    runnable.append(record)
+            if not runnable:
+                return None
+            record = min(runnable, key=lambda r: (r["priority"], r["created_at"]))
+            record.update(status=RUNNING, attempts=record["attempts"] + 1, worker=worker,
+                          lease_until=now + lease_seconds, started_at=now, progress=None, updated_at=now)
+            return self._job(record), json.loads(record["payload"])
+
+    def _update_owned(self, job_id: str, worker: str, **changes) -> bool:
+        # Only the worker holding the lease may change a running job
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None or record["worker"] != worker or record["status"] != RUNNING:
+                return False
+            record.update(changes, updated_at=time.time())
+            return True
+
+    def renew(self, job_id, worker, lease_seconds=JOB_LEASE_SECONDS, progress=None):
+        if progress is None:
+            return self._update_owned(job_id, worker, lease_until=time.time() + lease_seconds)
+        return self._update_owned(job_id, worker, lease_until=time.time() + lease_seconds,
+                                  progress=json.dumps(progress))
+
+    def complete(self, job_id, worker, result):
+        return self._update_owned(job_id, worker, status=SUCCEEDED, result=json.dumps(result), error=None,
+                                  payload=None, finished_at=time.time(), lease_until=None)
+
+    def fail(self, job_id, worker, error, retry_in):
+        now = time.time()
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None or record["worker"] != worker or record["status"] != RUNNING:
+                return False
+            if retry_in is not None and record["attempts"] < record["max_attempts"]:
+                record.update(status=QUEUED, error=error, available_at=now + retry_in, lease_until=None,
+                              updated_at=now)
+            else:
+                record.update(status=FAILED, error=error, finished_at=now, lease_until=None, updated_at=now)
+            return True
+
+    def get(self, job_id, include_result=True):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            return None if record is None else self._job(record, include_result)
+
+    def purge(self, older_than=JOB_RETENTION_SECONDS):
+        cutoff = time.time() - older_than
+        with self._lock:
+            expired = [job_id for job_id, r in self._jobs.items()
+                       if r["status"] in FINISHED and r["finished_at"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+            return len(expired)
+
+    def stats(self):
+        counts: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for record in self._jobs.values():
+                by_status = counts.setdefault(record["kind"], {})
+                by_status[record["status"]] = by_status.get(record["status"], 0) + 1
+        return {"broker": "memory", "jobs": counts}
+
+_brokers: Dict[str, Callable[[str], Broker]] = {
+    # sqlite:///relative/path.db or sqlite:////absolute/path.db
+    "sqlite": lambda url: SQLiteBroker(url.split(':///', 1)[1]),
+    "memory": lambda url: MemoryBroker(),
+}
+
+def register_broker(scheme: str, factory: Callable[[str], Broker]):
+    """Make JOBS_BROKER_URL=<scheme>://... build a broker with `factory(url)`."""
+    _brokers[scheme] = factory
+
+_broker: Broker | None = None
+_broker_lock = threading.Lock()
+
+def get_broker() -> Broker:
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            scheme = JOBS_BROKER_URL.split(':', 1)[0]
+            if scheme not in _brokers:
+                raise ValueError(f"Unknown job broker: {JOBS_BROKER_URL}")
+            _broker = _brokers[scheme](JOBS_BROKER_URL)
+        return _broker
@@ -0,0 +1,293 @@
+"""Background jobs for slow analysis (summaries, NER, multi-page reports).
+
+The API submits a job and returns its id straight away. Workers claim jobs
+from the broker (ai_services.job_broker), run them, and store the result.
+Clients poll GET /api/jobs/{id} or follow /api/jobs/{id}/events.
+
+Workers run inside the API process (JOBS_INPROCESS_WORKERS) and/or as
+separate processes. Separate processes scale independently of the API:
+
+    python -m ai_services.jobs --concurrency 2
+    python -m ai_services.jobs --concurrency 1 --kinds analyze_report
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Type
+from pydantic import BaseModel, ValidationError
+from ai_services.job_broker import JOB_LEASE_SECONDS, PRIORITIES, Broker, get_broker
+from ai_services.summarization_service import TextInput as SummaryInput, generate_summary
+from ai_services.ner_service import BatchTextInput, extract_entities_batch
+from ai_services.ocr_service import page_jobs, shutdown_ocr_pool
+from ai_services.ocr_store import ocr_writer
+from ai_services.report_pipeline import analyze_document, analyze_text, shutdown_report_pools
+
+logger = logging.getLogger(__name__)
+
+# Worker tasks started inside the API process; 0 when only standalone workers run jobs
+JOBS_INPROCESS_WORKERS = int(os.getenv('JOBS_INPROCESS_WORKERS', '1'))
+# How often an idle worker looks for new jobs
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '0.5'))
+# First retry delay; doubles with each attempt
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv('JOB_RETRY_BACKOFF_SECONDS', '5'))
+# Idle workers delete expired jobs at most this often
+JOB_PURGE_INTERVAL_SECONDS = 300
+
+Progress = Callable[[Dict], Awaitable[None]]
+
+class PermanentJobError(Exception):
+    """The job would fail the same way on every attempt, so it is not retried."""
+
+class JobHandler(NamedTuple):
+    run: Callable[[BaseModel, Progress], Awaitable]
+    schema: Type[BaseModel]
+
+HANDLERS: Dict[str, JobHandler] = {}
+
+def job_handler(kind: str, schema: Type[BaseModel]):
+    """Register `fn(validated payload, progress)` to run jobs of this kind."""
+    def decorator(fn):
+        HANDLERS[kind] = JobHandler(fn, schema)
+        return fn
+    return decorator
+
+def dedup_key(kind: str, payload: Dict) -> str:
+    return hashlib.sha256(f"{kind}\0{json.dumps(payload, sort_keys=True)}".encode()).hexdigest()
+
+class JobRequest(BaseModel):
+    kind: str
+    payload: Dict
+    priority: str = "interactive"  # or "batch"
+
+def submit_job(kind: str, payload: Dict, priority: str = "interactive", broker: Broker | None = None):
+    """Validate and queue a job; raises ValueError for an unknown kind or priority, ValidationError for bad input."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    payload = HANDLERS[kind].schema(**payload).dict()
+    broker = broker or get_broker()
+    job, created = broker.submit(kind, payload, PRIORITIES[priority], dedup_key(kind, payload))
+    if created:
+        _wake_local_workers()
+    return job, created
+
+class ReportFile(BaseModel):
+    filename: str | None = None
+    content_base64: str
+
+class ReportJob(BaseModel):
+    files: List[ReportFile] = []
+    text: str | None = None
+    mode: str = "quality"
+    user_id: str | None = None
+
+@job_handler("summarize", SummaryInput)
+async def summarize_job(text_input: SummaryInput, progress: Progress):
+    return await generate_summary(text_input)
+
+@job_handler("ner", BatchTextInput)
+async def ner_job(batch_input: BatchTextInput, progress: Progress):
+    return await extract_entities_batch(batch_input)
+
+@job_handler("analyze_report", ReportJob)
+async def analyze_report_job(report: ReportJob, progress: Progress):
+    if report.files:
+        jobs = []
+        for file in report.files:
+            jobs.extend(page_jobs(file.filename, base64.b64decode(file.content_base64)))
+        events = analyze_document(jobs, report.user_id, report.mode)
+    elif report.text is not None:
+        events = analyze_text(report.text, report.mode)
+    else:
+        raise PermanentJobError("A report job needs files or text")
+
+    # Same events as the streaming endpoint, merged into one entry per page
+    pages: Dict[int, Dict] = {}
+    async for event in events:
+        if event["stage"] == "done":
+            return {"pages": [pages[i] for i in sorted(pages)], "seconds": event["seconds"],
+                    "timings": event["timings"]}
+        page = pages.setdefault(event["index"], {"file": event["file"], "page": event["page"]})
+        stage = event.pop("stage")
+        for key in ("index", "file", "page"):
+            event.pop(key)
+        page[stage] = event
+        await progress({"stage": stage, "page": page["page"], "file": page["file"], "pages_seen": len(pages)})
+
+class JobWorker:
+    """Claims and runs jobs with `concurrency` tasks on the current event loop."""
+
+    def __init__(self, broker: Broker | None = None, concurrency: int = 1, kinds: List[str] | None = None,
+                 name: str | None = None):
+        self.broker = broker
+        self.concurrency = concurrency
+        self.kinds = kinds
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._event_loop: asyncio.AbstractEventLoop | None = None
+        self._tasks: List[asyncio.Task] = []
+        self._last_purge = 0.0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        self.broker = self.broker or get_broker()
+        # submit_job runs in pool threads; they wake us through this loop
+        self._event_loop = asyncio.get_running_loop()
+        _local_workers.add(self)
+        self._tasks = [asyncio.create_task(self._loop(f"{self.name}:{i}")) for i in range(self.concurrency)]
+
+    async def stop(self, wait: bool = True):
+        """Stop claiming; running jobs finish, or with wait=False are abandoned to be retried elsewhere."""
+        self._stopping.set()
+        self._wake.set()
+        _local_workers.discard(self)
+        if not wait:
+            for task in self._tasks:
+                task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def run(self):
+        self.start()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _loop(self, worker: str):
+        while not self._stopping.is_set():
+            try:
+                claimed = await asyncio.to_thread(self.broker.claim, worker, self.kinds)
+            except Exception as e:
+                logger.error(f"Failed to claim a job: {str(e)}")
+                claimed = None
+            if claimed is None:
+                await self._purge()
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(worker, *claimed)
+
+    async def _purge(self):
+        if time.monotonic() - self._last_purge < JOB_PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = time.monotonic()
+        try:
+            purged = await asyncio.to_thread(self.broker.purge)
+        except Exception as e:
+            logger.error(f"Failed to purge old jobs: {str(e)}")
+            return
+        if purged:
+            logger.info(f"Purged {purged} finished jobs")
+
+    async def _execute(self, worker: str, job: Dict, payload: Dict):
+        handler = HANDLERS.get(job["kind"])
+
+        lost = False
+        work: asyncio.Task | None = None
+
+        async def renew(data: Dict | None = None):
+            nonlocal lost
+            try:
+                owned = await asyncio.to_thread(self.broker.renew, job["id"], worker, JOB_LEASE_SECONDS, data)
+            except Exception as e:
+                # Retried on the next beat; the lease outlasts two missed renewals
+                logger.error(f"Failed to renew the lease on job {job['id']}: {str(e)}")
+                return
+            if not owned and not lost:
+                # Another worker claimed the job; don't keep running it alongside them
+                lost = True
+                if work is not None:
+                    work.cancel()
+
+        async def keep_lease():
+            while True:
+                await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+                await renew()
+
+        heartbeat = asyncio.create_task(keep_lease())
+        try:
+            if handler is None:
+                raise PermanentJobError(f"No handler for job kind '{job['kind']}'")
+            try:
+                job_input = handler.schema(**payload)
+            except ValidationError as e:
+                raise PermanentJobError(str(e)) from e
+            work = asyncio.create_task(handler.run(job_input, renew))
+            result = await work
+        except asyncio.CancelledError:
+            if not lost:
+                raise
+            logger.warning(f"Job {job['id']} lost its lease to another worker; stopped here")
+        except PermanentJobError as e:
+            # Bad input fails the same way every time; don't retry
+            self.failed += 1
+            await asyncio.to_thread(self.broker.fail, job["id"], worker, str(e), None)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Job {job['id']} ({job['kind']}) failed on attempt {job['attempts']}: {str(e)}")
+            retry_in = JOB_RETRY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1)
+            await asyncio.to_thread(self.broker.fail, job["id"], worker, str(e), retry_in)
+        else:
+            self.completed += 1
+            if not await asyncio.to_thread(self.broker.complete, job["id"], worker, result):
+                logger.warning(f"Job {job['id']} finished after its lease was taken over; result discarded")
+        finally:
+            heartbeat.cancel()
+
+    def stats(self) -> Dict:
+        return {"name": self.name, "concurrency": self.concurrency, "kinds": self.kinds,
+                "completed": self.completed, "failed": self.failed}
+
+# Workers in this process, woken on submit instead of waiting for their next poll
+_local_workers: set = set()
+
+def _wake_local_workers():
+    # Called from whatever thread submitted; asyncio.Event is only safe to set on its own loop
+    for worker in list(_local_workers):
+        try:
+            worker._event_loop.call_soon_threadsafe(worker._wake.set)
+        except RuntimeError:
+            pass  # loop already closed; the worker is stopping
+
+async def run_worker(concurrency: int, kinds: List[str] | None):
+    worker = JobWorker(concurrency=concurrency, kinds=kinds)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: asyncio.ensure_future(worker.stop()))
+    try:
+        await ocr_writer.start()
+    except Exception as e:
+        logger.error(f"OCR result persistence unavailable: {str(e)}")
+    logger.info(f"Job worker {worker.name} running {concurrency} at a time")
+    try:
+        await worker.run()
+    finally:
+        shutdown_ocr_pool()
+        shutdown_report_pools()
+        await ocr_writer.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument("--concurrency", type=int, default=1, help="jobs run at the same time")
+    parser.add_argument("--kinds", nargs="*", help=f"job kinds to run (default: all of {', '.join(HANDLERS)})")
+    args = parser.parse_args()
+
+    unknown = set(args.kinds or []) - set(HANDLERS)
+    if unknown:
+        parser.error(f"unknown job kinds: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker(args.concurrency, args.kinds or None))
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,27 @@ from pydantic import BaseModel
 from typing import List, Dict, Optional
 import json
 import os
+import re
+from ai_services.model_registry import registry
+from ai_services.metrics import stage
 
-# Load spaCy model
-nlp = spacy.load('en_core_web_sm')
+@registry.model("spacy_web_sm")
+def load_spacy():
+    # Load spaCy model
+    return spacy.load('en_core_web_sm')
+
+# Only the tagger, attribute ruler and lemmatizer are needed for lemmas
+SPACY_UNUSED_PIPES = ["parser", "ner"]
+
+# Keywords for each topic, highest priority first
+TOPIC_KEYWORDS = {
+    "greeting": ["hello", "hi", "hey", "greetings"],
+    "blood_pressure": ["blood", "pressure", "bp", "hypertension"],
+    "exercise": ["exercise", "workout", "fitness", "activity", "gym"],
+    "diet": ["diet", "food", "nutrition", "eat", "eating"],
+    "sleep": ["sleep", "rest", "insomnia", "tired"],
+    "stress": ["stress", "anxiety", "worried", "tension"]
+}
 
 class Message(BaseModel):
     role: str
@@ -56,32 +74,54 @@ class LocalChatbotService:
                 "For personalized medical advice, please consult with a healthcare provider."
             ]
         }
+
+        # Topics in priority order: the first topic with a matching keyword wins
+        self._topic_order = list(TOPIC_KEYWORDS)
+        self._keyword_priority = {
+            keyword: priority
+            for priority, keywords in enumerate(TOPIC_KEYWORDS.values())
+            for keyword in keywords
+        }
+        # Whole words only, so "hi" doesn't match "this"
+        alternatives = sorted(self._keyword_priority, key=len, reverse=True)
+        self._keyword_pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, alternatives)) + r")\b", re.IGNORECASE)
     
+    def _match_keywords(self, text: str) -> str | None:
+        """Highest-priority topic with a keyword in the text, in one regex pass."""
+        best = None
+        for match in self._keyword_pattern.finditer(text):
+            priority = self._keyword_priority[match.group(0).lower()]
+            if best is None or priority < best:
+                best = priority
+                if priority == 0:
+                    break
+        return self._topic_order[best] if best is not None else None
+
+    def _match_lemmas(self, doc) -> str:
+        # Catches inflected forms the exact keywords miss ("exercises", "slept")
+        priorities = [self._keyword_priority[token.lemma_.lower()] for token in doc
+                      if token.lemma_.lower() in self._keyword_priority]
+        return self._topic_order[min(priorities)] if priorities else "default"
+
     def _get_topic(self, text: str) -> str:
-        """Use spaCy to analyze the text and determine the topic."""
-        doc = nlp(text.lower())
-        
-        # Define keywords for each topic
-        topics = {
-            "greeting": ["hello", "hi", "hey", "greetings"],
-            "blood_pressure": ["blood", "pressure", "bp", "hypertension"],
-            "exercise": ["exercise", "workout", "fitness", "activity", "gym"],
-            "diet": ["diet", "food", "nutrition", "eat", "eating"],
-            "sleep": ["sleep", "rest", "insomnia", "tired"],
-            "stress": ["stress", "anxiety", "worried", "tension"]
-        }
-        
-        # Check for topic keywords in the text
-        for topic, keywords in topics.items():
-            if any(keyword in text.lower() for keyword in keywords):
-                return topic
-                
-        # Use spaCy's entity recognition as a fallback
-        entities = [ent.label_ for ent in doc.ents]
-        if "HEALTH" in entities or "CONDITION" in entities:
-            return "health"
-            
-        return "default"
+        """Match topic keywords, falling back to spaCy lemmas only when none match."""
+        topic = self._match_keywords(text)
+        if topic is not None:
+            return topic
+        nlp = registry.get("spacy_web_sm")
+        with stage("topic.spacy"):
+            return self._match_lemmas(nlp(text, disable=SPACY_UNUSED_PIPES))
+
+    def classify_topics(self, texts: List[str], batch_size: int = 256) -> List[str]:
+        """Topic for each text; spaCy only sees the texts no keyword matched."""
+        topics = [self._match_keywords(text) for text in texts]
+        unmatched = [i for i, topic in enumerate(topics) if topic is None]
+        if unmatched:
+            nlp = registry.get("spacy_web_sm")
+            docs = nlp.pipe((texts[i] for i in unmatched), batch_size=batch_size, disable=SPACY_UNUSED_PIPES)
+            for i, doc in zip(unmatched, docs):
+                topics[i] = self._match_lemmas(doc)
+        return topics
     
     def _format_health_context(self, user_data: Dict) -> str:
         """Format user health data into a readable context string."""
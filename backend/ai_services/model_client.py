@@ -0,0 +1,145 @@
+"""Client side of the model server sidecar (see ai_services.model_server).
+
+With MODEL_SERVER_SOCKET set, the service functions that need a large model
+(risk scoring, NER, summarization, embeddings) forward their call over the
+Unix socket instead of loading the model in this process. API workers then
+stay small however many of them run.
+
+Frames are a 4-byte length followed by a pickle. Only processes that can
+open the socket (mode 0600, same user) can talk to the server.
+"""
+import asyncio
+import os
+import pickle
+import queue
+import socket
+import struct
+import threading
+from typing import Any, AsyncIterator, Iterator
+
+MODEL_SERVER_SOCKET = os.getenv('MODEL_SERVER_SOCKET', '')
+# Summaries with beam search can take a while on a busy server
+MODEL_SERVER_TIMEOUT = float(os.getenv('MODEL_SERVER_TIMEOUT', '300'))
+
+_HEADER = struct.Struct('!I')
+_END = object()
+
+class RemoteError(RuntimeError):
+    """The model server raised an exception without a local equivalent."""
+
+# Re-raised as themselves so callers' handling (e.g. ValueError -> 400) still applies
+PASSTHROUGH_ERRORS = {e.__name__: e for e in (ValueError, KeyError, FileNotFoundError, TypeError)}
+
+def send_frame(sock: socket.socket, message: Any):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            raise EOFError("Model server connection closed")
+        buffer += chunk
+    return bytes(buffer)
+
+def recv_frame(sock: socket.socket) -> Any:
+    size, = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return pickle.loads(_recv_exactly(sock, size))
+
+def _unwrap(status: str, value: Any) -> Any:
+    if status == "error":
+        error_type, message = value
+        raise PASSTHROUGH_ERRORS.get(error_type, RemoteError)(message)
+    return value
+
+class ModelClient:
+    """Thread-safe; keeps idle connections open for reuse."""
+
+    def __init__(self, path: str, timeout: float = MODEL_SERVER_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+
+    def _acquire(self) -> socket.socket:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            return sock
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        for attempt in range(2):
+            sock = self._acquire()
+            try:
+                send_frame(sock, (method, args, kwargs))
+                status, value = recv_frame(sock)
+            except (ConnectionError, EOFError):
+                # A pooled connection from before a server restart; model calls are safe to repeat
+                sock.close()
+                if attempt:
+                    raise
+                continue
+            except BaseException:
+                sock.close()
+                raise
+            self._idle.put(sock)
+            return _unwrap(status, value)
+
+    def stream(self, method: str, *args, **kwargs) -> Iterator:
+        """Yield the items of a streaming method; closing early drops the connection."""
+        sock = self._acquire()
+        try:
+            send_frame(sock, (method, args, kwargs))
+            while True:
+                status, value = recv_frame(sock)
+                if status == "end":
+                    break
+                if status == "item":
+                    yield value
+                else:
+                    _unwrap(status, value)
+        except BaseException:
+            sock.close()
+            raise
+        self._idle.put(sock)
+
+    async def astream(self, method: str, *args, **kwargs) -> AsyncIterator:
+        items = self.stream(method, *args, **kwargs)
+        try:
+            while True:
+                item = await asyncio.to_thread(next, items, _END)
+                if item is _END:
+                    return
+                yield item
+        finally:
+            try:
+                items.close()
+            except ValueError:
+                pass  # still running in its thread after a cancel; it ends with the stream
+
+_client: ModelClient | None = None
+_client_lock = threading.Lock()
+_serving = False
+
+def serve_locally():
+    """Called by the model server itself, which must never forward to itself."""
+    global _serving
+    _serving = True
+
+def get_model_client() -> ModelClient | None:
+    """The shared client when models are served by a sidecar, otherwise None."""
+    global _client
+    if not MODEL_SERVER_SOCKET or _serving:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ModelClient(MODEL_SERVER_SOCKET)
+    return _client
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """Loads each registered model at most once, on first use or when warmed."""
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._models: Dict[str, Any] = {}
+        self._timings: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        if name in self._loaders:
+            raise ValueError(f"Model '{name}' is already registered")
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    def model(self, name: str):
+        """Decorator form of register()."""
+        def decorator(loader: Callable[[], Any]):
+            self.register(name, loader)
+            return loader
+        return decorator
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._loaders)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def get(self, name: str) -> Any:
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self._loaders:
+            raise KeyError(f"Model '{name}' is not registered")
+
+        with self._locks[name]:
+            # Another thread may have finished loading while we waited
+            if name in self._models:
+                return self._models[name]
+            start = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                self._errors[name] = str(e)
+                logger.error(f"Failed to load model '{name}': {str(e)}")
+                raise
+            self._timings[name] = time.perf_counter() - start
+            self._errors.pop(name, None)
+            self._models[name] = model
+            logger.info(f"Loaded model '{name}' in {self._timings[name]:.2f}s")
+            return model
+
+    def warm(self, names: Iterable[str] | None = None, max_workers: int | None = None) -> Dict:
+        """Load models in parallel; failures are recorded in status() rather than raised."""
+        names = [n for n in (names or self.names) if not self.is_loaded(n)]
+        if names:
+            with ThreadPoolExecutor(max_workers=max_workers or len(names), thread_name_prefix='model-warm') as pool:
+                futures = [pool.submit(self.get, name) for name in names]
+                for future in futures:
+                    future.exception()
+        return self.status()
+
+    def unload(self, name: str):
+        with self._locks[name]:
+            self._models.pop(name, None)
+            self._timings.pop(name, None)
+
+    def status(self) -> Dict:
+        return {
+            name: {
+                'loaded': name in self._models,
+                'load_seconds': round(self._timings[name], 3) if name in self._timings else None,
+                'error': self._errors.get(name)
+            }
+            for name in self._loaders
+        }
+
+registry = ModelRegistry()
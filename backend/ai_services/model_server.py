@@ -0,0 +1,151 @@
+"""Model server: one process holding the large models for every API worker.
+
+Each uvicorn worker that loads PEGASUS, BioBERT, MiniLM and the risk models
+itself holds its own copy of the weights, so memory grows with --workers.
+Run the models once here instead and point the API at the socket:
+
+    python -m ai_services.model_server --socket /run/health-ai/models.sock
+    MODEL_SERVER_SOCKET=/run/health-ai/models.sock uvicorn main:app --workers 8
+
+API workers then forward risk scoring, NER, summarization and embeddings
+(see ai_services.model_client). They never import TensorFlow, XGBoost,
+torch, transformers, sentence-transformers or spaCy (each service imports
+these inside its model loaders), so each API worker stays a plain FastAPI
+process; OpenCV, PyMuPDF and Tesseract load only once a worker handles a
+scan. Every connection gets its own thread; the models are
+shared between threads as they are in a single API process. The server
+also owns risk model versions: it watches MODELS_DIR and the admin
+endpoints of any worker act on it.
+"""
+import argparse
+import asyncio
+import inspect
+import logging
+import os
+import signal
+import socketserver
+import threading
+from typing import Callable, Dict, List
+from ai_services import model_client
+from ai_services.model_client import MODEL_SERVER_SOCKET, recv_frame, send_frame
+from ai_services.model_registry import registry
+from ai_services.model_versions import get_risk_predictor, model_versions
+from ai_services.risk_prediction_service import HealthMetrics
+from ai_services.ner_service import extract_entities_sync
+from ai_services.summarization_service import summarize_sync, stream_summary
+from ai_services.semantic_cache import embed
+
+logger = logging.getLogger(__name__)
+
+METHODS: Dict[str, Callable] = {}
+
+def method(name: str):
+    """Expose `fn` to clients as `name`; async generator functions are streamed item by item."""
+    def decorator(fn):
+        METHODS[name] = fn
+        return fn
+    return decorator
+
+@method("ping")
+def ping() -> int:
+    return os.getpid()
+
+@method("risk.score")
+def score_risk(metrics_list: List[HealthMetrics], version: str | None = None) -> List[Dict]:
+    return get_risk_predictor(version).score_batch(metrics_list)
+
+@method("models.routing")
+def routing():
+    model_versions.ensure_active()
+    return model_versions.routing()
+
+METHODS.update({
+    "ner.extract": extract_entities_sync,
+    "summarize": summarize_sync,
+    "summarize.stream": stream_summary,
+    "embed": embed,
+    "models.status": model_versions.status,
+    "models.available": model_versions.available,
+    "models.activate": model_versions.activate,
+    "models.set_ab": model_versions.set_ab,
+    "registry.status": registry.status,
+})
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            while True:
+                try:
+                    name, args, kwargs = recv_frame(self.request)
+                except EOFError:
+                    return
+                self._dispatch(name, args, kwargs)
+        except ConnectionError:
+            pass  # client went away, e.g. a summary stream it stopped reading
+
+    def _dispatch(self, name: str, args: tuple, kwargs: dict):
+        fn = METHODS.get(name)
+        try:
+            if fn is None:
+                raise KeyError(f"Unknown model server method: {name}")
+            if inspect.isasyncgenfunction(fn):
+                asyncio.run(self._stream(fn(*args, **kwargs)))
+                send_frame(self.request, ("end", None))
+                return
+            result = fn(*args, **kwargs)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            if not isinstance(e, (KeyError, ValueError)):
+                logger.error(f"Model server call {name} failed: {str(e)}")
+            send_frame(self.request, ("error", (type(e).__name__, str(e))))
+            return
+        send_frame(self.request, ("ok", result))
+
+    async def _stream(self, items):
+        # A send failing here closes the generator, which stops its generate thread
+        async for item in items:
+            send_frame(self.request, ("item", item))
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)  # left over from a server that didn't exit cleanly
+        # Owner only: requests are unpickled
+        previous = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(previous)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve models to API workers over a Unix socket")
+    parser.add_argument("--socket", default=MODEL_SERVER_SOCKET or "model_server.sock")
+    parser.add_argument("--warm", nargs="*", default=["all"],
+                        help=f"models to load before accepting connections (default: all of {', '.join(registry.names)})")
+    args = parser.parse_args()
+
+    model_client.serve_locally()
+    logging.basicConfig(level=logging.INFO)
+
+    # Failures are logged and show up in registry.status; those models load on first use
+    registry.warm(None if args.warm == ["all"] else args.warm)
+    model_versions.start_watching()
+
+    server = ModelServer(args.socket, _Handler)
+    # shutdown() waits for serve_forever, so it can't run on the thread serving
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    logger.info(f"Model server {os.getpid()} listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        model_versions.stop_watching()
+        server.server_close()
+        os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""Versioned risk models with background loading and zero-downtime swaps.
+
+Each version lives in its own directory under MODELS_DIR:
+
+    models/
+        2024-06-01/risk_prediction_xgb.model
+        2024-06-01/risk_prediction_tflite.tflite
+        2024-07-15/...
+
+Copy a new version in under a temporary name (anything starting with "." or
+ending in ".tmp" is ignored) and rename it when complete. A watcher thread
+picks it up, loads and warms it off the request path, then makes it active
+with a single reference swap; requests already holding the previous
+predictor finish on it. Model files placed directly in MODELS_DIR are served
+as version "default".
+
+With a model server (ai_services.model_server) the server owns the versions;
+here status and admin calls are forwarded to it, and the watcher only
+refreshes the routing used by choose().
+
+With process pool inference (INFERENCE_MODE=process) this process only
+routes: loading is delegated to the pool, whose workers each load and warm
+a version before it is activated or given A/B traffic.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Set, Tuple
+import numpy as np
+from ai_services.model_registry import registry
+from ai_services.model_client import get_model_client
+from ai_services.risk_prediction_service import (HealthMetrics, RiskPrediction, TFLITE_MODEL_FILE,
+                                                 XGB_MODEL_FILE)
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = os.getenv('MODELS_DIR', 'models')
+MODEL_POLL_SECONDS = float(os.getenv('MODEL_POLL_SECONDS', '10'))
+# Activate the newest version as soon as it is warm; set to 0 to only activate through the admin API
+MODEL_AUTO_ACTIVATE = os.getenv('MODEL_AUTO_ACTIVATE', '1') == '1'
+# Send this fraction of traffic to MODEL_AB_VERSION instead of the active version
+MODEL_AB_VERSION = os.getenv('MODEL_AB_VERSION') or None
+MODEL_AB_SPLIT = float(os.getenv('MODEL_AB_SPLIT', '0'))
+# Versions kept loaded besides the active and A/B ones, for in-flight requests and rollback
+MODEL_KEEP_PREVIOUS = int(os.getenv('MODEL_KEEP_PREVIOUS', '1'))
+
+DEFAULT_VERSION = 'default'
+
+# Run through every new version before it takes traffic
+CANNED_METRICS = [
+    HealthMetrics(age=35, gender='female', height=165, weight=60, blood_pressure_systolic=115,
+                  blood_pressure_diastolic=75, heart_rate=68, blood_sugar=90, cholesterol=180,
+                  smoking=False, alcohol_consumption=2, physical_activity_hours=5),
+    HealthMetrics(age=62, gender='male', height=178, weight=98, blood_pressure_systolic=152,
+                  blood_pressure_diastolic=96, heart_rate=84, blood_sugar=145, cholesterol=260,
+                  smoking=True, alcohol_consumption=10, physical_activity_hours=1),
+]
+
+def _version_key(version: str):
+    # Natural order, so v10 sorts after v9
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', version)]
+
+def _has_models(path: str) -> bool:
+    return all(os.path.isfile(os.path.join(path, f)) for f in (XGB_MODEL_FILE, TFLITE_MODEL_FILE))
+
+class ModelVersionManager:
+    def __init__(self, models_dir: str = MODELS_DIR, poll_seconds: float = MODEL_POLL_SECONDS,
+                 auto_activate: bool = MODEL_AUTO_ACTIVATE, ab_version: str | None = MODEL_AB_VERSION,
+                 ab_split: float = MODEL_AB_SPLIT, keep_previous: int = MODEL_KEEP_PREVIOUS):
+        self.models_dir = models_dir
+        self.poll_seconds = poll_seconds
+        self.auto_activate = auto_activate
+        self.ab_version = ab_version
+        self.ab_split = ab_split
+        self.keep_previous = keep_previous
+
+        # Values are None for versions loaded by a delegate (see delegate_loading)
+        self._predictors: Dict[str, RiskPrediction | None] = {}
+        self._active: str | None = None
+        self._history: List[str] = []  # previously active versions, most recent last
+        self._errors: Dict[str, str] = {}
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+        # (active, A/B version, split) last fetched from the model server
+        self._remote_routing: Tuple[str | None, str | None, float] | None = None
+        self._preload: Callable[[str | None, Set[str]], None] | None = None
+
+    def delegate_loading(self, preload: Callable[[str | None, Set[str]], None]):
+        """Load versions elsewhere instead of in this process.
+
+        `preload(version, keep)` must load and warm `version` (None: load
+        nothing) wherever predictions run, and drop versions not in `keep`.
+        """
+        self._preload = preload
+
+    def model_dir(self, version: str) -> str:
+        return self.models_dir if version == DEFAULT_VERSION else os.path.join(self.models_dir, version)
+
+    def available(self) -> List[str]:
+        """Complete versions on disk, oldest first."""
+        client = get_model_client()
+        if client is not None:
+            return client.call("models.available")
+        versions = []
+        if os.path.isdir(self.models_dir):
+            for name in os.listdir(self.models_dir):
+                if name.startswith('.') or name.endswith('.tmp'):
+                    continue
+                if _has_models(os.path.join(self.models_dir, name)):
+                    versions.append(name)
+        versions.sort(key=_version_key)
+        if not versions and _has_models(self.models_dir):
+            versions.append(DEFAULT_VERSION)
+        return versions
+
+    def load(self, version: str) -> RiskPrediction | None:
+        """Load and warm a version without affecting traffic; None when loading is delegated."""
+        with self._load_lock:
+            if version in self._predictors:
+                return self._predictors[version]
+            start = time.perf_counter()
+            try:
+                if self._preload is not None:
+                    predictor = None
+                    self._preload(version, self._keep() | {version})
+                else:
+                    predictor = self._load_local(version)
+            except Exception as e:
+                self._errors[version] = str(e)
+                logger.error(f"Failed to load risk model version '{version}': {str(e)}")
+                raise
+            self._errors.pop(version, None)
+            self._predictors[version] = predictor
+            logger.info(f"Loaded risk model version '{version}' in {time.perf_counter() - start:.2f}s")
+            return predictor
+
+    def _load_local(self, version: str) -> RiskPrediction:
+        predictor = RiskPrediction(self.model_dir(version), version)
+        # Warm: first invokes allocate tensors and page in the models
+        results = predictor.score_batch(CANNED_METRICS)
+        scores = [s for r in results for s in r['risk_scores'].values()]
+        if not np.all(np.isfinite(scores)):
+            raise ValueError("non-finite risk scores on canned inputs")
+        return predictor
+
+    def activate(self, version: str):
+        client = get_model_client()
+        if client is not None:
+            client.call("models.activate", version)
+            self._refresh_routing(client)
+            return
+        self.load(version)
+        previous = self._active
+        if previous == version:
+            return
+        # Single reference swap; requests that already fetched the old predictor keep using it
+        self._active = version
+        if previous is not None:
+            self._history.append(previous)
+        self._evict()
+        logger.info(f"Risk model version '{version}' is now active (was '{previous}')")
+
+    def set_ab(self, version: str | None, split: float):
+        if not 0 <= split <= 1:
+            raise ValueError("split must be between 0 and 1")
+        client = get_model_client()
+        if client is not None:
+            client.call("models.set_ab", version, split)
+            self._refresh_routing(client)
+            return
+        if version is not None:
+            self.load(version)
+        self.ab_version, self.ab_split = version, split
+        self._evict()
+
+    def _keep(self) -> Set[str]:
+        keep = {self._active, self.ab_version}
+        if self.keep_previous:
+            keep.update(self._history[-self.keep_previous:])
+        keep.discard(None)
+        return keep
+
+    def _evict(self):
+        keep = self._keep()
+        self._history = [v for v in self._history if v in keep]
+        evicted = [v for v in self._predictors if v not in keep]
+        for version in evicted:
+            del self._predictors[version]
+        if evicted and self._preload is not None:
+            with self._load_lock:
+                self._preload(None, keep)
+
+    def retain(self, versions: Set[str]):
+        """Drop loaded versions not in `versions`; used where a delegate does the loading."""
+        for version in [v for v in self._predictors if v not in versions]:
+            del self._predictors[version]
+        if self._active not in self._predictors:
+            self._active = None
+
+    def ensure_active(self) -> 'ModelVersionManager':
+        """Load the newest version if nothing is active yet (first request or warmup)."""
+        if self._active is None:
+            versions = self.available()
+            if not versions:
+                raise FileNotFoundError(f"No risk model versions found in {self.models_dir}")
+            self.activate(versions[-1])
+        return self
+
+    @property
+    def active(self) -> str | None:
+        return self._active
+
+    def routing(self) -> Tuple[str | None, str | None, float]:
+        """Active version, A/B version (once it is loaded) and A/B split."""
+        ab_version = self.ab_version if self.ab_version in self._predictors else None
+        return self._active, ab_version, self.ab_split
+
+    def choose(self, key: str) -> str:
+        """Version to serve a request with; the same key always lands on the same side of a split."""
+        active, ab_version, ab_split = self._remote_routing or self.routing()
+        if ab_version and ab_split > 0:
+            bucket = zlib.crc32(key.encode()) / 2**32
+            if bucket < ab_split:
+                return ab_version
+        return active
+
+    def get(self, version: str | None = None) -> RiskPrediction | None:
+        """Loaded predictor for `version`, or the active one; None when loading is delegated."""
+        self.ensure_active()
+        if version is not None:
+            predictor = self._predictors.get(version)
+            if predictor is not None:
+                return predictor
+        return self._predictors[self._active]
+
+    def check(self):
+        """One watcher pass: load anything new and activate the newest version."""
+        client = get_model_client()
+        if client is not None:
+            self._refresh_routing(client)
+            return
+        versions = self.available()
+        if not versions:
+            return
+        newest = versions[-1]
+        wanted = [v for v in (newest, self.ab_version) if v in versions]
+        for version in wanted:
+            if version not in self._predictors and version not in self._errors:
+                try:
+                    self.load(version)
+                except Exception:
+                    continue  # recorded in status(); not retried until restart
+        if (self.auto_activate or self._active is None) and newest != self.ab_version \
+                and newest in self._predictors:
+            self.activate(newest)
+
+    def _refresh_routing(self, client):
+        # Other API workers pick up a change on their next watcher pass
+        self._remote_routing = tuple(client.call("models.routing"))
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Risk model watcher failed: {str(e)}")
+
+    def start_watching(self):
+        if self._watcher is None and self.poll_seconds > 0:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+            self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+
+    def status(self) -> Dict:
+        client = get_model_client()
+        if client is not None:
+            return client.call("models.status")
+        return {
+            "models_dir": self.models_dir,
+            "active": self._active,
+            "ab_version": self.ab_version,
+            "ab_split": self.ab_split,
+            "loaded": sorted(self._predictors, key=_version_key),
+            "available": self.available(),
+            "errors": dict(self._errors)
+        }
+
+model_versions = ModelVersionManager()
+
+# "risk_prediction" is loaded when the first version is activated
+registry.register('risk_prediction', model_versions.ensure_active)
+
+def get_risk_predictor(version: str | None = None) -> RiskPrediction:
+    """Predictor for `version` if it is loaded, otherwise the active one."""
+    return registry.get('risk_prediction').get(version)
@@ -1,54 +1,164 @@
-import spacy
-from transformers import AutoTokenizer, AutoModelForTokenClassification
-import torch
 from fastapi import FastAPI
 from pydantic import BaseModel
 import os
+import asyncio
+import threading
 from typing import List, Dict
+from ai_services.model_registry import registry
+from ai_services import onnx_export
+from ai_services.metrics import stage
+from ai_services.model_client import get_model_client
 
-# Load BioBERT model and tokenizer
-tokenizer = AutoTokenizer.from_pretrained("dmis-lab/biobert-base-cased-v1.2")
-model = AutoModelForTokenClassification.from_pretrained("dmis-lab/biobert-base-cased-v1.2")
+# torch, transformers and spacy are imported where they are used, so API workers
+# that forward NER to a model server never load them
 
-# Load SciSpacy model
-nlp = spacy.load("en_core_sci_scibert")
+def load_biobert_torch():
+    from transformers import AutoTokenizer, AutoModelForTokenClassification
+
+    # Load BioBERT model and tokenizer
+    tokenizer = AutoTokenizer.from_pretrained("dmis-lab/biobert-base-cased-v1.2")
+    model = AutoModelForTokenClassification.from_pretrained("dmis-lab/biobert-base-cased-v1.2")
+    return tokenizer, model
+
+@registry.model("biobert")
+def load_biobert():
+    # Prefer the int8 ONNX export when one has been built
+    if onnx_export.use_onnx("biobert"):
+        return onnx_export.load_token_classifier("biobert")
+    return load_biobert_torch()
+
+@registry.model("scispacy")
+def load_scispacy():
+    import spacy
+
+    # Load SciSpacy model
+    return spacy.load("en_core_sci_scibert")
+
+# BioBERT window size and the overlap between consecutive windows of a long report
+NER_MAX_LENGTH = 512
+NER_STRIDE = 128
+NER_BATCH_SIZE = int(os.getenv('NER_BATCH_SIZE', '16'))
+NER_SPACY_PROCESSES = int(os.getenv('NER_SPACY_PROCESSES', '1'))
+
+# Fast tokenizers raise "Already borrowed" when shared across threads
+_tokenizer_lock = threading.Lock()
 
 class TextInput(BaseModel):
     text: str
 
-async def extract_entities(text_input: TextInput) -> Dict:
-    # Process with SciSpacy
-    doc = nlp(text_input.text)
-    
-    entities = []
-    for ent in doc.ents:
-        entities.append({
-            "text": ent.text,
-            "label": ent.label_,
-            "start": ent.start_char,
-            "end": ent.end_char
-        })
-    
-    # Process with BioBERT
-    inputs = tokenizer(text_input.text, return_tensors="pt", padding=True, truncation=True)
-    outputs = model(**inputs)
-    predictions = torch.argmax(outputs.logits, dim=2)
-    
-    tokens = tokenizer.convert_ids_to_tokens(inputs["input_ids"][0])
-    biobert_entities = []
-    
-    current_entity = {"text": "", "label": "", "start": 0}
-    for idx, (token, pred) in enumerate(zip(tokens, predictions[0])):
-        if pred != 0:  # Not 'O' label
-            if current_entity["text"] == "":
-                current_entity["start"] = idx
-            current_entity["text"] += token.replace("##", "")
-            current_entity["label"] = model.config.id2label[pred.item()]
-        elif current_entity["text"]:
+class BatchTextInput(BaseModel):
+    texts: List[str]
+
+def _scispacy_entities(texts: List[str], n_process: int) -> List[List[Dict]]:
+    nlp = registry.get("scispacy")
+    results = []
+    for doc in nlp.pipe(texts, n_process=n_process, batch_size=NER_BATCH_SIZE):
+        results.append([
+            {
+                "text": ent.text,
+                "label": ent.label_,
+                "start": ent.start_char,
+                "end": ent.end_char
+            }
+            for ent in doc.ents
+        ])
+    return results
+
+def _biobert_entities(texts: List[str], batch_size: int) -> List[List[Dict]]:
+    import torch
+
+    tokenizer, model = registry.get("biobert")
+
+    # Split every report into overlapping windows so nothing past 512 tokens is dropped
+    with _tokenizer_lock:
+        encoded = tokenizer(
+            texts,
+            truncation=True,
+            max_length=NER_MAX_LENGTH,
+            stride=NER_STRIDE,
+            return_overflowing_tokens=True,
+            return_offsets_mapping=True
+        )
+    window_doc = encoded["overflow_to_sample_mapping"]
+    window_ids = encoded["input_ids"]
+
+    # Sort windows by length so each batch pads as little as possible
+    order = sorted(range(len(window_ids)), key=lambda w: len(window_ids[w]))
+
+    # Per document: token start char -> (distance from window edge, end char, label id).
+    # Overlapping tokens keep the prediction from the window where they had the most context.
+    tokens = [{} for _ in texts]
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            batch_windows = order[start:start + batch_size]
+            with _tokenizer_lock:
+                features = {
+                    "input_ids": [window_ids[w] for w in batch_windows],
+                    "attention_mask": [encoded["attention_mask"][w] for w in batch_windows]
+                }
+                # The ONNX graph takes token_type_ids as a required input
+                if "token_type_ids" in encoded:
+                    features["token_type_ids"] = [encoded["token_type_ids"][w] for w in batch_windows]
+                batch = tokenizer.pad(features, return_tensors="pt")
+            predictions = torch.argmax(model(**batch).logits, dim=2).tolist()
+
+            for row, w in enumerate(batch_windows):
+                doc_tokens = tokens[window_doc[w]]
+                length = len(window_ids[w])
+                for pos, (char_start, char_end) in enumerate(encoded["offset_mapping"][w]):
+                    if char_start == char_end:  # [CLS], [SEP]
+                        continue
+                    margin = min(pos, length - 1 - pos)
+                    previous = doc_tokens.get(char_start)
+                    if previous is None or margin > previous[0]:
+                        doc_tokens[char_start] = (margin, char_end, predictions[row][pos])
+
+    results = []
+    for text, doc_tokens in zip(texts, tokens):
+        biobert_entities = []
+        current_entity = None
+        for char_start in sorted(doc_tokens):
+            _, char_end, pred = doc_tokens[char_start]
+            if pred != 0:  # Not 'O' label
+                if current_entity is None:
+                    current_entity = {"start": char_start}
+                current_entity["end"] = char_end
+                current_entity["label"] = model.config.id2label[pred]
+            elif current_entity:
+                biobert_entities.append(current_entity)
+                current_entity = None
+        if current_entity:
             biobert_entities.append(current_entity)
-            current_entity = {"text": "", "label": "", "start": 0}
-    
-    return {
-        "scispacy_entities": entities,
-        "biobert_entities": biobert_entities
-    } 
\ No newline at end of file
+
+        for entity in biobert_entities:
+            entity["text"] = text[entity["start"]:entity["end"]]
+        results.append(biobert_entities)
+    return results
+
+def extract_entities_sync(texts: List[str], batch_size: int = NER_BATCH_SIZE,
+                          n_process: int = NER_SPACY_PROCESSES) -> List[Dict]:
+    """Run SciSpacy and BioBERT over many documents at once."""
+    if not texts:
+        return []
+    client = get_model_client()
+    if client is not None:
+        with stage("ner.remote"):
+            return client.call("ner.extract", texts, batch_size, n_process)
+    with stage("ner.scispacy"):
+        scispacy_entities = _scispacy_entities(texts, n_process)
+    with stage("ner.biobert"):
+        biobert_entities = _biobert_entities(texts, batch_size)
+    return [
+        {
+            "scispacy_entities": scispacy,
+            "biobert_entities": biobert
+        }
+        for scispacy, biobert in zip(scispacy_entities, biobert_entities)
+    ]
+
+async def extract_entities(text_input: TextInput) -> Dict:
+    results = await asyncio.to_thread(extract_entities_sync, [text_input.text], n_process=1)
+    return results[0]
+
+async def extract_entities_batch(batch_input: BatchTextInput) -> List[Dict]:
+    return await asyncio.to_thread(extract_entities_sync, batch_input.texts)
@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+OCR_CACHE_PATH = os.getenv('OCR_CACHE_PATH', 'cache/ocr_cache.sqlite3')
+OCR_CACHE_MAX_BYTES = int(os.getenv('OCR_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Max differing bits between two 256-bit dHashes for an entry to be a near-duplicate candidate
+OCR_CACHE_MAX_DISTANCE = int(os.getenv('OCR_CACHE_MAX_DISTANCE', '8'))
+
+PHASH_SIZE = 16
+PHASH_BYTES = PHASH_SIZE * PHASH_SIZE // 8
+# Near-duplicate candidates are confirmed on a binarized copy of the page at this width
+FINGERPRINT_WIDTH = 1024
+# How many hash candidates to confirm before giving up
+MAX_CANDIDATES = 3
+
+class ImageSignature(NamedTuple):
+    key: str  # sha256 of the raw bytes
+    phash: bytes | None  # dHash, None if the bytes don't decode
+    fingerprint: bytes | None  # PNG of the binarized, width-normalized page
+
+def image_signature(contents: bytes) -> ImageSignature:
+    # Not at module scope: workers that never see an image upload skip loading OpenCV
+    import cv2
+
+    key = hashlib.sha256(contents).hexdigest()
+    gray = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return ImageSignature(key, None, None)
+
+    # Difference hash: is each cell brighter than its left neighbour?
+    small = cv2.resize(gray, (PHASH_SIZE + 1, PHASH_SIZE), interpolation=cv2.INTER_AREA)
+    phash = np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+
+    height = max(1, round(gray.shape[0] * FINGERPRINT_WIDTH / gray.shape[1]))
+    norm = cv2.resize(gray, (FINGERPRINT_WIDTH, height), interpolation=cv2.INTER_AREA)
+    norm = cv2.threshold(norm, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    return ImageSignature(key, phash, cv2.imencode('.png', norm)[1].tobytes())
+
+def same_page(fingerprint_a: bytes, fingerprint_b: bytes) -> bool:
+    """True if two fingerprints differ only by re-encoding/resampling noise.
+
+    A perceptual hash alone can't tell "Glucose 120" from "Glucose 199", so
+    any difference thicker than two pixels (a changed digit, an added decimal
+    point) rejects the match.
+    """
+    import cv2
+
+    a = cv2.imdecode(np.frombuffer(fingerprint_a, np.uint8), cv2.IMREAD_GRAYSCALE)
+    b = cv2.imdecode(np.frombuffer(fingerprint_b, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if abs(a.shape[0] - b.shape[0]) > 0.02 * a.shape[0]:
+        return False
+    if a.shape != b.shape:
+        b = cv2.resize(b, (a.shape[1], a.shape[0]), interpolation=cv2.INTER_NEAREST)
+    diff = cv2.bitwise_xor(a, b)
+    diff = cv2.morphologyEx(diff, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+    return cv2.countNonZero(diff) == 0
+
+class OCRResultCache:
+    """On-disk OCR result cache keyed by content hash, with a near-duplicate tier.
+
+    Entries live in a memory-mapped SQLite file so they survive restarts; the
+    least recently used entries are evicted once stored text and fingerprints
+    exceed `max_bytes`.
+    """
+
+    def __init__(self, path: str = OCR_CACHE_PATH, max_bytes: int = OCR_CACHE_MAX_BYTES,
+                 max_distance: int = OCR_CACHE_MAX_DISTANCE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+        self.exact_hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(f"PRAGMA mmap_size={self.max_bytes * 2}")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS ocr_cache (
+                    key TEXT PRIMARY KEY,
+                    phash BLOB,
+                    fingerprint BLOB,
+                    text TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS ix_ocr_cache_last_access ON ocr_cache (last_access)")
+            self._db = db
+
+            # Keep the perceptual hashes in memory for vectorized nearest-neighbour lookups
+            rows = db.execute("SELECT key, phash FROM ocr_cache WHERE phash IS NOT NULL").fetchall()
+            self._phash_keys = [key for key, _ in rows]
+            self._phashes = np.frombuffer(b"".join(phash for _, phash in rows), dtype=np.uint8).reshape(-1, PHASH_BYTES)
+            self._size = db.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+        return self._db
+
+    def _touch(self, key: str) -> str | None:
+        row = self._db.execute("SELECT text FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE ocr_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def _candidates(self, phash: bytes) -> list:
+        if not len(self._phashes):
+            return []
+        xor = np.bitwise_xor(self._phashes, np.frombuffer(phash, dtype=np.uint8))
+        distances = np.unpackbits(xor, axis=1).sum(axis=1)
+        nearest = np.argsort(distances)[:MAX_CANDIDATES]
+        return [self._phash_keys[i] for i in nearest if distances[i] <= self.max_distance]
+
+    def get(self, key: str) -> str | None:
+        """Exact lookup only, e.g. for a PDF page keyed on document hash and page number."""
+        with self._lock:
+            self._connect()
+            text = self._touch(key)
+            if text is None:
+                self.misses += 1
+            else:
+                self.exact_hits += 1
+            return text
+
+    def lookup_image(self, contents: bytes) -> Tuple[str | None, ImageSignature | None]:
+        """Return (cached text or None, signature to pass to put_image() on a miss)."""
+        key = hashlib.sha256(contents).hexdigest()
+        with self._lock:
+            self._connect()
+            text = self._touch(key)
+            if text is not None:
+                self.exact_hits += 1
+                return text, None
+
+        signature = image_signature(contents)
+        if signature.phash is not None:
+            with self._lock:
+                candidates = [
+                    (k, self._db.execute("SELECT fingerprint FROM ocr_cache WHERE key = ?", (k,)).fetchone())
+                    for k in self._candidates(signature.phash)
+                ]
+            for candidate_key, row in candidates:
+                if row is not None and same_page(row[0], signature.fingerprint):
+                    with self._lock:
+                        text = self._touch(candidate_key)
+                    if text is not None:
+                        self.perceptual_hits += 1
+                        return text, signature
+
+        self.misses += 1
+        return None, signature
+
+    def put(self, key: str, text: str, phash: bytes | None = None, fingerprint: bytes | None = None):
+        size = len(text.encode()) + len(fingerprint or b"")
+        with self._lock:
+            db = self._connect()
+            old = db.execute("SELECT size, phash FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO ocr_cache (key, phash, fingerprint, text, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, phash, fingerprint, text, size, time.time())
+            )
+            if old is not None:
+                self._size -= old[0]
+            if phash is not None and (old is None or old[1] is None):
+                self._phash_keys.append(key)
+                self._phashes = np.vstack([self._phashes, np.frombuffer(phash, dtype=np.uint8)])
+            self._size += size
+            self._evict()
+
+    def put_image(self, signature: ImageSignature, text: str):
+        self.put(signature.key, text, signature.phash, signature.fingerprint)
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        evicted = set()
+        for key, size in self._db.execute("SELECT key, size FROM ocr_cache ORDER BY last_access").fetchall():
+            if self._size <= self.max_bytes:
+                break
+            evicted.add(key)
+            self._size -= size
+        self._db.executemany("DELETE FROM ocr_cache WHERE key = ?", [(key,) for key in evicted])
+        self.evictions += len(evicted)
+
+        keep = [i for i, key in enumerate(self._phash_keys) if key not in evicted]
+        self._phash_keys = [self._phash_keys[i] for i in keep]
+        self._phashes = self._phashes[keep]
+
+    def stats(self) -> Dict:
+        lookups = self.exact_hits + self.perceptual_hits + self.misses
+        hits = self.exact_hits + self.perceptual_hits
+        with self._lock:
+            db = self._connect()
+            entries = db.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+        return {
+            "path": self.path,
+            "entries": entries,
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "exact_hits": self.exact_hits,
+            "perceptual_hits": self.perceptual_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+        }
+
+ocr_cache = OCRResultCache()
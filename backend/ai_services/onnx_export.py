@@ -0,0 +1,148 @@
+"""Export transformer models to int8 ONNX and load them through ONNX Runtime.
+
+Run from the backend directory to build (or rebuild) the cached artifacts:
+
+    python -m ai_services.onnx_export biobert pegasus
+
+Loaders in ner_service and summarization_service use an export when one is
+present under ONNX_MODEL_DIR and fall back to PyTorch otherwise.
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_DIR = os.getenv('ONNX_MODEL_DIR', 'models/onnx')
+# Set USE_ONNX=0 to ignore existing exports and always serve PyTorch
+USE_ONNX = os.getenv('USE_ONNX', '1') == '1'
+# 0 lets ONNX Runtime pick (one thread per physical core)
+ORT_INTRA_OP_THREADS = int(os.getenv('ORT_INTRA_OP_THREADS', '0'))
+ORT_INTER_OP_THREADS = int(os.getenv('ORT_INTER_OP_THREADS', '0'))
+
+# Exportable models: name -> (Hugging Face checkpoint, task)
+EXPORTS: Dict[str, Tuple[str, str]] = {
+    "biobert": ("dmis-lab/biobert-base-cased-v1.2", "token-classification"),
+    "pegasus": ("google/pegasus-large", "text2text-generation"),
+}
+
+# File names written by optimum for each task
+ONNX_FILES = {
+    "token-classification": ["model.onnx"],
+    "text2text-generation": ["encoder_model.onnx", "decoder_model.onnx", "decoder_with_past_model.onnx"],
+}
+
+def export_dir(name: str) -> str:
+    return os.path.join(ONNX_MODEL_DIR, name)
+
+def _quantized(file_name: str) -> str:
+    return file_name.replace(".onnx", "_quantized.onnx")
+
+def is_exported(name: str) -> bool:
+    _, task = EXPORTS[name]
+    return all(os.path.exists(os.path.join(export_dir(name), _quantized(f))) for f in ONNX_FILES[task])
+
+def use_onnx(name: str) -> bool:
+    return USE_ONNX and is_exported(name)
+
+def session_options():
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = ORT_INTRA_OP_THREADS
+    options.inter_op_num_threads = ORT_INTER_OP_THREADS
+    if ORT_INTER_OP_THREADS > 1:
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+    return options
+
+def export(name: str, force: bool = False) -> str:
+    """Export a model to ONNX and quantize its weights to int8 (dynamic quantization)."""
+    from optimum.onnxruntime import (ORTModelForSeq2SeqLM, ORTModelForTokenClassification, ORTQuantizer)
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    target = export_dir(name)
+    if is_exported(name) and not force:
+        logger.info(f"ONNX export for '{name}' already exists at {target}")
+        return target
+
+    checkpoint, task = EXPORTS[name]
+    model_class = ORTModelForTokenClassification if task == "token-classification" else ORTModelForSeq2SeqLM
+    os.makedirs(ONNX_MODEL_DIR, exist_ok=True)
+
+    # Build in a scratch directory next to the target, then swap it in, so a
+    # crashed export never leaves a half-written model behind
+    staging = tempfile.mkdtemp(prefix=f".{name}-", dir=ONNX_MODEL_DIR)
+    try:
+        model_class.from_pretrained(checkpoint, export=True).save_pretrained(staging)
+        AutoTokenizer.from_pretrained(checkpoint).save_pretrained(staging)
+
+        # AVX2 kernels run on every x86 node we deploy to
+        config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        for file_name in ONNX_FILES[task]:
+            quantizer = ORTQuantizer.from_pretrained(staging, file_name=file_name)
+            quantizer.quantize(save_dir=staging, quantization_config=config)
+        # Only the int8 graphs are served; drop the fp32 ones (and their external weight files)
+        for file_name in os.listdir(staging):
+            if ".onnx" in file_name and "_quantized" not in file_name:
+                os.remove(os.path.join(staging, file_name))
+
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    logger.info(f"Exported '{name}' to {target}")
+    return target
+
+def load_token_classifier(name: str = "biobert"):
+    """(tokenizer, model) for an exported token classification model."""
+    from optimum.onnxruntime import ORTModelForTokenClassification
+    from transformers import AutoTokenizer
+
+    path = export_dir(name)
+    model = ORTModelForTokenClassification.from_pretrained(
+        path,
+        file_name=_quantized("model.onnx"),
+        session_options=session_options(),
+        provider="CPUExecutionProvider"
+    )
+    return AutoTokenizer.from_pretrained(path), model
+
+def load_seq2seq(name: str = "pegasus"):
+    """(tokenizer, model) for an exported encoder-decoder model."""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    from transformers import AutoTokenizer
+
+    path = export_dir(name)
+    model = ORTModelForSeq2SeqLM.from_pretrained(
+        path,
+        encoder_file_name=_quantized("encoder_model.onnx"),
+        decoder_file_name=_quantized("decoder_model.onnx"),
+        decoder_with_past_file_name=_quantized("decoder_with_past_model.onnx"),
+        session_options=session_options(),
+        provider="CPUExecutionProvider"
+    )
+    return AutoTokenizer.from_pretrained(path), model
+
+def main():
+    parser = argparse.ArgumentParser(description="Export models to int8 ONNX")
+    parser.add_argument("models", nargs="*", help=f"models to export (default: all of {', '.join(EXPORTS)})")
+    parser.add_argument("--force", action="store_true", help="re-export even if artifacts exist")
+    args = parser.parse_args()
+
+    unknown = set(args.models) - set(EXPORTS)
+    if unknown:
+        parser.error(f"unknown models: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO)
+    for name in args.models or EXPORTS:
+        export(name, force=args.force)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Sampling CPU profiler and allocation tracer for the live server process.
+
+The CPU profiler periodically walks sys._current_frames(), so the code being
+profiled runs unmodified; at the default 100 Hz the cost is a few percent of
+one core. Samples taken on the event loop thread are attributed to the route
+whose task was running at the time.
+"""
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+from typing import Dict, List, Tuple
+
+AI_SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
+MAX_PROFILE_SECONDS = float(os.getenv('MAX_PROFILE_SECONDS', '60'))
+
+# Leaf frames of threads that are blocked waiting for work, not burning CPU
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("queues.py", "get"),
+    ("process.py", "_process_worker"),
+    ("connection.py", "_recv"),
+}
+
+# Request task -> route, filled in by tag_current_task() as requests arrive
+_task_routes: "weakref.WeakKeyDictionary[asyncio.Task, str]" = weakref.WeakKeyDictionary()
+
+# Only one profile at a time; two samplers would just measure each other
+profile_lock = asyncio.Lock()
+
+def tag_current_task(route: str):
+    task = asyncio.current_task()
+    if task is not None:
+        _task_routes[task] = route
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+def _stack(frame) -> Tuple[List[str], Tuple[str, str]]:
+    """Frames root first, plus the leaf's (file, function) for idle detection."""
+    leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return names, leaf
+
+class SamplingProfiler:
+    """Counts collapsed stacks of every thread at a fixed interval.
+
+    When the event loop runs in the main thread (as under uvicorn), samples are
+    driven by SIGPROF on a CPU-time timer: an idle process takes no samples,
+    and the loop thread is caught at the bytecode it was executing. Otherwise
+    a sampler thread wakes on wall-clock time; it can only look at the loop
+    while it has released the GIL, which skews samples towards I/O waits.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = 0.01, include_idle: bool = False):
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.routes: Counter = Counter()
+        self.samples = 0
+        self.clock = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._previous_handler = None
+
+    def _route_for(self, thread_id: int, thread_names: Dict[int, str]) -> str | None:
+        if thread_id == self.loop_thread:
+            task = getattr(asyncio.tasks, "_current_tasks", {}).get(self.loop)
+            if task is None:
+                return None  # between tasks, usually waiting in select()
+            return _task_routes.get(task, "[event loop]")
+        return f"[thread {thread_names.get(thread_id, thread_id)}]"
+
+    def _sample(self, loop_frame=None):
+        own = threading.get_ident() if loop_frame is None else None
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            if thread_id == self.loop_thread and loop_frame is not None:
+                frame = loop_frame  # the frame the signal interrupted, not the handler's
+            route = self._route_for(thread_id, thread_names)
+            names, leaf = _stack(frame)
+            if not self.include_idle and (route is None or leaf in IDLE_LEAVES):
+                continue
+            route = route or "[idle]"
+            self.stacks[";".join([route] + names)] += 1
+            self.routes[route] += 1
+            self.samples += 1
+
+    def _on_signal(self, signum, frame):
+        self._sample(frame)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if threading.current_thread() is threading.main_thread() and hasattr(signal, "setitimer"):
+            self.clock = "cpu"
+            self._previous_handler = signal.signal(signal.SIGPROF, self._on_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self.clock = "wall"
+            self._thread.start()
+
+    def stop(self):
+        if self.clock == "cpu":
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        else:
+            self._stop.set()
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed format, with the route as the root frame."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, seconds: float, top: int) -> Dict:
+        self_time: Counter = Counter()
+        for stack, count in self.stacks.items():
+            self_time[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "seconds": seconds,
+            "interval_ms": self.interval * 1000,
+            "clock": self.clock,
+            "samples": self.samples,
+            "routes": [
+                {"route": route, "samples": count, "share": round(count / self.samples, 4)}
+                for route, count in self.routes.most_common()
+            ],
+            "top_frames": [
+                {"frame": frame, "samples": count, "share": round(count / self.samples, 4)}
+                for frame, count in self_time.most_common(top)
+            ]
+        }
+
+async def profile_cpu(seconds: float, interval: float, include_idle: bool = False) -> Tuple[SamplingProfiler, float]:
+    profiler = SamplingProfiler(asyncio.get_running_loop(), interval, include_idle)
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    return profiler, time.perf_counter() - start
+
+def _ai_services_frames(traceback: tracemalloc.Traceback) -> List[str]:
+    return [
+        f"{os.path.relpath(frame.filename, os.path.dirname(AI_SERVICES_DIR))}:{frame.lineno}"
+        for frame in traceback
+        if frame.filename.startswith(AI_SERVICES_DIR)
+    ]
+
+async def profile_allocations(seconds: float, top: int, frames: int = 25) -> Dict:
+    """Diff two tracemalloc snapshots taken `seconds` apart, keeping ai_services code paths."""
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(frames)
+    only_ours = [tracemalloc.Filter(True, os.path.join(AI_SERVICES_DIR, "*"), all_frames=True)]
+
+    def snapshot():
+        return tracemalloc.take_snapshot().filter_traces(only_ours)
+
+    # Snapshots and diffs of a large heap take a while; keep them off the event loop
+    try:
+        before = await asyncio.to_thread(snapshot)
+        await asyncio.sleep(seconds)
+        after = await asyncio.to_thread(snapshot)
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    by_path = await asyncio.to_thread(after.compare_to, before, "traceback")
+    by_line = await asyncio.to_thread(after.compare_to, before, "lineno")
+    return {
+        "seconds": seconds,
+        "code_paths": [
+            {
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "count_diff": stat.count_diff,
+                "size_kb": round(stat.size / 1024, 1),
+                "stack": _ai_services_frames(stat.traceback)
+            }
+            for stat in by_path[:top]
+        ],
+        "lines": [
+            {
+                "line": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "count_diff": stat.count_diff
+            }
+            for stat in by_line[:top]
+        ]
+    }
@@ -0,0 +1,115 @@
+import json
+import operator
+import os
+from typing import Any, Dict, List, NamedTuple, Type
+import numpy as np
+from pydantic import BaseModel
+
+RULES_PATH = os.path.join(os.path.dirname(__file__), 'rules', 'recommendations.json')
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne
+}
+
+class FrozenDict(dict):
+    """A dict that refuses modification, so cached payloads can be shared safely."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Recommendation payloads are read-only")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        # Pickle (e.g. back from a process pool worker) without going through __setitem__
+        return (FrozenDict, (dict(self),))
+
+def freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+class Predicate(NamedTuple):
+    field: str
+    op: str
+    threshold: float
+
+class CompiledRule(NamedTuple):
+    id: str
+    combine: Any  # any / all
+    predicates: tuple  # indexes into RecommendationRules.predicates
+    payload: FrozenDict
+    points: int
+
+class RecommendationRules:
+    """Recommendation rules compiled from a declarative table.
+
+    Every distinct comparison is evaluated once per request; rules then only
+    combine those booleans and return pre-validated, pre-serialized payloads.
+    """
+
+    def __init__(self, rules: List[Dict], schema: Type[BaseModel] | None = None):
+        self.predicates: List[Predicate] = []
+        self._funcs = []
+        predicate_ids: Dict[Predicate, int] = {}
+        self.rules: List[CompiledRule] = []
+
+        for rule in rules:
+            (combine, conditions), = rule['when'].items()
+            if combine not in ('any', 'all'):
+                raise ValueError(f"Rule {rule['id']}: unknown combinator '{combine}'")
+
+            ids = []
+            for field, op, threshold in conditions:
+                if op not in OPERATORS:
+                    raise ValueError(f"Rule {rule['id']}: unknown operator '{op}'")
+                predicate = Predicate(field, op, threshold)
+                if predicate not in predicate_ids:
+                    predicate_ids[predicate] = len(self.predicates)
+                    self.predicates.append(predicate)
+                    self._funcs.append((field, OPERATORS[op], threshold))
+                ids.append(predicate_ids[predicate])
+
+            # Validate once here instead of building models on every request
+            payload = rule['recommendation']
+            if schema is not None:
+                payload = schema(**payload).dict()
+            self.rules.append(CompiledRule(
+                id=rule['id'],
+                combine=any if combine == 'any' else all,
+                predicates=tuple(ids),
+                payload=freeze(payload),
+                points=payload['potential_points']
+            ))
+
+    @classmethod
+    def from_file(cls, path: str = RULES_PATH, schema: Type[BaseModel] | None = None) -> 'RecommendationRules':
+        with open(path) as f:
+            return cls(json.load(f), schema=schema)
+
+    @property
+    def fields(self) -> List[str]:
+        return sorted({p.field for p in self.predicates})
+
+    def matching_rules(self, metrics: BaseModel) -> List[CompiledRule]:
+        results = [op(getattr(metrics, field), threshold) for field, op, threshold in self._funcs]
+        return [rule for rule in self.rules if rule.combine(results[i] for i in rule.predicates)]
+
+    def evaluate(self, metrics: BaseModel) -> List[FrozenDict]:
+        return [rule.payload for rule in self.matching_rules(metrics)]
+
+    def match_matrix(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Vectorized matching_rules(): an N x len(rules) boolean matrix for N rows of field arrays."""
+        results = [op(columns[field], threshold) for field, op, threshold in self._funcs]
+        rows = len(next(iter(columns.values())))
+        matrix = np.empty((rows, len(self.rules)), dtype=bool)
+        for j, rule in enumerate(self.rules):
+            combine = np.logical_or if rule.combine is any else np.logical_and
+            matrix[:, j] = combine.reduce([results[i] for i in rule.predicates])
+        return matrix
@@ -0,0 +1,211 @@
+"""Staged OCR -> NER -> summarization pipeline for uploaded medical reports.
+
+Each stage has its own workers and pool (OCR processes, NER threads,
+summarization threads). The stages are connected by bounded queues, so page
+N+1 is being OCR'd while page N is in NER or summarization. A full queue
+makes the previous stage wait instead of piling up pages in memory.
+
+One event is emitted per page per stage as soon as that stage finishes the
+page. A final "done" event carries per-stage timings. Compare each stage's
+busy time and queue wait to decide which pool to grow.
+
+A stage that fails on a page puts "error" in its event. The later stages
+still run on the page's text, and their events list the failure under
+"upstream_errors".
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+from ai_services.ocr_service import OCR_WORKERS, NO_TEXT_MESSAGE, cached_ocr, get_ocr_pool
+from ai_services.ocr_store import ocr_writer
+from ai_services.ner_service import extract_entities_sync
+from ai_services.summarization_service import TextInput as SummaryInput, summarize_sync
+from ai_services.metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+REPORT_NER_WORKERS = int(os.getenv('REPORT_NER_WORKERS', '1'))
+REPORT_SUMMARY_WORKERS = int(os.getenv('REPORT_SUMMARY_WORKERS', '1'))
+# Pages allowed to wait between two stages
+REPORT_QUEUE_SIZE = int(os.getenv('REPORT_QUEUE_SIZE', '4'))
+
+_ner_pool: ThreadPoolExecutor | None = None
+_summary_pool: ThreadPoolExecutor | None = None
+
+def get_ner_pool() -> ThreadPoolExecutor:
+    global _ner_pool
+    if _ner_pool is None:
+        _ner_pool = ThreadPoolExecutor(max_workers=REPORT_NER_WORKERS, thread_name_prefix='report-ner')
+    return _ner_pool
+
+def get_summary_pool() -> ThreadPoolExecutor:
+    global _summary_pool
+    if _summary_pool is None:
+        _summary_pool = ThreadPoolExecutor(max_workers=REPORT_SUMMARY_WORKERS, thread_name_prefix='report-summary')
+    return _summary_pool
+
+def shutdown_report_pools():
+    global _ner_pool, _summary_pool
+    for pool in (_ner_pool, _summary_pool):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    _ner_pool = _summary_pool = None
+
+class StageTimings:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.pages = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.queued = 0.0
+        self.slowest = 0.0
+
+    def observe(self, busy: float, queued: float, ok: bool):
+        self.pages += 1
+        self.errors += not ok
+        self.busy += busy
+        self.queued += queued
+        self.slowest = max(self.slowest, busy)
+        observe_stage(f"report.{self.name}", busy)
+
+    def summary(self, wall: float) -> Dict:
+        return {
+            "workers": self.workers,
+            "pages": self.pages,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy, 3),
+            "mean_seconds": round(self.busy / self.pages, 3) if self.pages else None,
+            "max_seconds": round(self.slowest, 3),
+            # Time pages spent waiting for this stage; high means too few workers here
+            "queued_seconds": round(self.queued, 3),
+            # Share of the stage's worker time spent working
+            "utilization": round(self.busy / (wall * self.workers), 3) if wall else None
+        }
+
+# A stage step takes a page, updates it for the next stage and returns the fields to report
+Step = Callable[[Dict], Awaitable[Dict]]
+
+def _ocr_step(user_id: str | None) -> Step:
+    pool = get_ocr_pool()
+
+    async def run(page: Dict) -> Dict:
+        fn, args, cache_key = page.pop("job")
+        text, _, cached = await cached_ocr(pool, fn, args, cache_key)
+        if text:
+            ocr_writer.submit(text, user_id)
+        page["text"] = text
+        return {"text": text or NO_TEXT_MESSAGE, "cached": cached}
+    return run
+
+async def _ner_step(page: Dict) -> Dict:
+    loop = asyncio.get_running_loop()
+    entities = await loop.run_in_executor(get_ner_pool(), partial(extract_entities_sync, [page["text"]], n_process=1))
+    return {"entities": entities[0]}
+
+def _summary_step(mode: str) -> Step:
+    async def run(page: Dict) -> Dict:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(get_summary_pool(), summarize_sync, SummaryInput(text=page["text"], mode=mode))
+        return {"summary": result["summary"]}
+    return run
+
+async def _run_stage(timings: StageTimings, step: Step, inbox: asyncio.Queue, outbox: asyncio.Queue | None,
+                     downstream_workers: int, events: asyncio.Queue):
+    async def worker():
+        while True:
+            page = await inbox.get()
+            if page is None:
+                return
+            start = time.perf_counter()
+            event = {"stage": timings.name, "index": page["index"], "file": page["file"], "page": page["page"]}
+            if page.get("errors"):
+                # Earlier stages that failed on this page, so their gap is visible next to this result
+                event["upstream_errors"] = dict(page["errors"])
+            try:
+                event.update(await step(page))
+            except Exception as e:
+                logger.error(f"Report {timings.name} failed on page {page['page']} of {page['file']}: {str(e)}")
+                event["error"] = str(e)
+                page.setdefault("errors", {})[timings.name] = str(e)
+            busy = time.perf_counter() - start
+            event["seconds"] = round(busy, 3)
+            timings.observe(busy, start - page["enqueued"], "error" not in event)
+            events.put_nowait(event)
+            # Later stages only need the text, so a failure here (e.g. NER) doesn't hold the page
+            # back; pages without text (OCR failed or found nothing) have nothing for them
+            if outbox is not None and page.get("text"):
+                page["enqueued"] = time.perf_counter()
+                await outbox.put(page)
+
+    await asyncio.gather(*[worker() for _ in range(timings.workers)])
+    if outbox is not None:
+        for _ in range(downstream_workers):
+            await outbox.put(None)
+
+async def run_pipeline(pages: List[Dict], stages: List[Tuple[str, int, Step]]) -> AsyncIterator[Dict]:
+    """Push pages through the stages, yielding each stage's event per page as it happens."""
+    events: asyncio.Queue = asyncio.Queue()
+    queues = [asyncio.Queue(maxsize=REPORT_QUEUE_SIZE) for _ in stages]
+    timings = [StageTimings(name, workers) for name, workers, _ in stages]
+    start = time.perf_counter()
+
+    async def feed():
+        for page in pages:
+            page["enqueued"] = time.perf_counter()
+            await queues[0].put(page)
+        for _ in range(stages[0][1]):
+            await queues[0].put(None)
+
+    async def run():
+        done = {"stage": "done", "pages": len(pages)}
+        try:
+            await asyncio.gather(feed(), *[
+                _run_stage(timings[i], step, queues[i], queues[i + 1] if i + 1 < len(stages) else None,
+                           stages[i + 1][1] if i + 1 < len(stages) else 0, events)
+                for i, (_, _, step) in enumerate(stages)
+            ])
+        except Exception as e:
+            logger.error(f"Report pipeline failed: {str(e)}")
+            done["error"] = str(e)
+        wall = time.perf_counter() - start
+        done["seconds"] = round(wall, 3)
+        done["timings"] = {t.name: t.summary(wall) for t in timings}
+        events.put_nowait(done)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            event = await events.get()
+            yield event
+            if event["stage"] == "done":
+                return
+    finally:
+        # Stop feeding the pools once nobody is listening (client went away)
+        task.cancel()
+
+def analyze_document(jobs: List[Tuple], user_id: str | None = None, mode: str = "quality") -> AsyncIterator[Dict]:
+    """Analyze the pages of uploaded files (see ocr_service.document_jobs)."""
+    pages = [
+        {"index": index, "file": filename, "page": page_number, "job": (fn, args, cache_key)}
+        for index, (filename, page_number, fn, args, cache_key) in enumerate(jobs)
+    ]
+    stages = [
+        ("ocr", min(OCR_WORKERS, max(1, len(pages))), _ocr_step(user_id)),
+        ("ner", REPORT_NER_WORKERS, _ner_step),
+        ("summary", REPORT_SUMMARY_WORKERS, _summary_step(mode)),
+    ]
+    return run_pipeline(pages, stages)
+
+def analyze_text(text: str, mode: str = "quality") -> AsyncIterator[Dict]:
+    """Analyze text that was already extracted (e.g. OCR'd in the browser)."""
+    pages = [{"index": 0, "file": None, "page": 0, "text": text}]
+    stages = [
+        ("ner", REPORT_NER_WORKERS, _ner_step),
+        ("summary", REPORT_SUMMARY_WORKERS, _summary_step(mode)),
+    ]
+    return run_pipeline(pages, stages)
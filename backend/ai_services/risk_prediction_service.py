@@ -1,11 +1,32 @@
-import xgboost as xgb
-import tensorflow as tf
 import numpy as np
-from fastapi import FastAPI
 from pydantic import BaseModel
-from typing import List, Dict
-import joblib
+from typing import TYPE_CHECKING, List, Dict, Callable
 import os
+import threading
+import hashlib
+import json
+from ai_services.cache import TTLCache
+from ai_services.recommendation_rules import RecommendationRules
+from ai_services.metrics import stage
+
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+# Largest batch pushed through the TFLite interpreter in a single invoke()
+TFLITE_MAX_BATCH = 256
+
+def _parse_quantization(spec: str) -> Dict[str, float]:
+    """Parse 'weight=0.1,height=0.5' into a field -> step mapping."""
+    steps = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        field, step = part.split('=')
+        steps[field.strip()] = float(step)
+    return steps
+
+# Prediction cache settings; quantization is opt-in since it trades exactness for hit rate
+RISK_CACHE_SIZE = int(os.getenv('RISK_CACHE_SIZE', '10000'))
+RISK_CACHE_TTL = float(os.getenv('RISK_CACHE_TTL', '300'))
+RISK_CACHE_QUANTIZE = _parse_quantization(os.getenv('RISK_CACHE_QUANTIZE', ''))
 
 class HealthMetrics(BaseModel):
     age: int
@@ -40,21 +61,81 @@ class HealthRecommendation(BaseModel):
     tasks: List[Task]
     potential_points: int
 
+# Compiled once at import; see ai_services/rules/recommendations.json
+recommendation_rules = RecommendationRules.from_file(schema=HealthRecommendation)
+
+def metrics_cache_key(metrics: HealthMetrics, quantization: Dict[str, float] = RISK_CACHE_QUANTIZE) -> str:
+    """Canonical hash of the metrics, with fields optionally rounded to a step."""
+    values = []
+    for field, value in metrics.dict().items():
+        if field == 'gender':
+            value = value.lower()
+        elif field in quantization:
+            value = round(round(value / quantization[field]) * quantization[field], 6)
+        values.append(value)
+    return hashlib.blake2b(json.dumps(values).encode(), digest_size=16).hexdigest()
+
+prediction_cache = TTLCache(maxsize=RISK_CACHE_SIZE, ttl=RISK_CACHE_TTL)
+
+# Called after the models are reloaded so cached predictions never outlive them
+_reload_hooks: List[Callable[[], None]] = [prediction_cache.clear]
+
+def register_reload_hook(hook: Callable[[], None]):
+    _reload_hooks.append(hook)
+
+# Column order of the feature matrix built by RiskPrediction._feature_row
+FEATURE_FIELDS = (
+    'age', 'gender', 'height', 'weight', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+    'heart_rate', 'blood_sugar', 'cholesterol', 'smoking', 'alcohol_consumption', 'physical_activity_hours'
+)
+# Columns of the combined risk matrix returned by RiskPrediction.run_models
+RISK_CATEGORIES = ('heart_disease', 'diabetes', 'stroke', 'hypertension')
+
+# File names inside a model directory
+XGB_MODEL_FILE = 'risk_prediction_xgb.model'
+TFLITE_MODEL_FILE = 'risk_prediction_tflite.tflite'
+
 class RiskPrediction:
-    def __init__(self):
+    def __init__(self, model_dir: str = 'models', version: str = 'default'):
+        self.model_dir = model_dir
+        self.version = version
+        self.load_models()
+
+    def load_models(self):
+        # Imported here so API workers that forward to a model server never load them
+        import joblib
+
         # Load XGBoost model
-        self.xgb_model = joblib.load('models/risk_prediction_xgb.model')
+        self.xgb_model = joblib.load(os.path.join(self.model_dir, XGB_MODEL_FILE))
         
-        # Load TensorFlow Lite model
-        self.interpreter = tf.lite.Interpreter(model_path='models/risk_prediction_tflite.tflite')
-        self.interpreter.allocate_tensors()
+        # TFLite interpreters are not thread-safe, so every thread gets its own
+        self.tflite_path = os.path.join(self.model_dir, TFLITE_MODEL_FILE)
+        self._local = threading.local()
+        interpreter = self.get_interpreter()
         
-        self.input_details = self.interpreter.get_input_details()
-        self.output_details = self.interpreter.get_output_details()
+        self.input_details = interpreter.get_input_details()
+        self.output_details = interpreter.get_output_details()
 
-    def preprocess_data(self, metrics: HealthMetrics) -> np.ndarray:
-        # Convert to numpy array
-        data = np.array([
+    def reload_models(self):
+        """Reload the model files in model_dir and invalidate anything derived from them."""
+        self.load_models()
+        for hook in _reload_hooks:
+            hook()
+
+    def get_interpreter(self) -> 'tf.lite.Interpreter':
+        """Return the calling thread's TFLite interpreter, loading it on first use."""
+        interpreter = getattr(self._local, 'interpreter', None)
+        if interpreter is None:
+            import tensorflow as tf
+
+            interpreter = tf.lite.Interpreter(model_path=self.tflite_path)
+            interpreter.allocate_tensors()
+            self._local.interpreter = interpreter
+            self._local.batch_size = int(interpreter.get_input_details()[0]['shape'][0])
+        return interpreter
+
+    def _feature_row(self, metrics: HealthMetrics) -> List[float]:
+        return [
             metrics.age,
             1 if metrics.gender.lower() == 'male' else 0,
             metrics.height,
@@ -67,124 +148,63 @@ class RiskPrediction:
             1 if metrics.smoking else 0,
             metrics.alcohol_consumption,
             metrics.physical_activity_hours
-        ]).reshape(1, -1)
+        ]
+
+    def preprocess_data(self, metrics: HealthMetrics) -> np.ndarray:
+        # Convert to numpy array
+        data = np.array(self._feature_row(metrics)).reshape(1, -1)
         return data
 
+    def preprocess_batch(self, metrics_list: List[HealthMetrics]) -> np.ndarray:
+        """Build one N x 12 feature matrix for a batch of metrics."""
+        return np.array([self._feature_row(m) for m in metrics_list]).reshape(len(metrics_list), -1)
+
     def normalize_score(self, score: float) -> int:
         """Normalize score to 0-100 range"""
         return max(0, min(100, int(score * 100)))
 
-    def generate_tasks(self, metrics: HealthMetrics, risk_scores: Dict) -> List[HealthRecommendation]:
-        recommendations = []
-        
-        # Exercise recommendations
-        if metrics.physical_activity_hours < 3:
-            tasks = [
-                Task(
-                    id="exercise_1",
-                    title="Daily Walk",
-                    description="Take a 30-minute walk today",
-                    points=50,
-                    difficulty="easy",
-                    category="exercise"
-                ),
-                Task(
-                    id="exercise_2",
-                    title="Strength Training",
-                    description="Complete 15 minutes of basic strength exercises",
-                    points=75,
-                    difficulty="medium",
-                    category="exercise"
-                )
-            ]
-            recommendations.append(HealthRecommendation(
-                type="exercise",
-                priority="high",
-                title="Increase Physical Activity",
-                description="Regular exercise helps improve overall health and reduce health risks.",
-                impact="Reduces risk of heart disease and improves fitness",
-                tasks=tasks,
-                potential_points=125
-            ))
-
-        # Blood pressure management
-        if metrics.blood_pressure_systolic > 140 or metrics.blood_pressure_diastolic > 90:
-            tasks = [
-                Task(
-                    id="bp_1",
-                    title="BP Monitoring",
-                    description="Record your blood pressure twice today",
-                    points=30,
-                    difficulty="easy",
-                    category="medical"
-                ),
-                Task(
-                    id="bp_2",
-                    title="Salt Reduction",
-                    description="Keep sodium intake under 2000mg today",
-                    points=60,
-                    difficulty="medium",
-                    category="diet"
-                )
-            ]
-            recommendations.append(HealthRecommendation(
-                type="lifestyle",
-                priority="high",
-                title="Blood Pressure Management",
-                description="Managing blood pressure is crucial for heart health.",
-                impact="Reduces risk of cardiovascular complications",
-                tasks=tasks,
-                potential_points=90
-            ))
-
-        # Blood sugar management
-        if metrics.blood_sugar > 100:
-            tasks = [
-                Task(
-                    id="sugar_1",
-                    title="Glucose Check",
-                    description="Check blood sugar before and after meals",
-                    points=40,
-                    difficulty="easy",
-                    category="medical"
-                ),
-                Task(
-                    id="sugar_2",
-                    title="Carb Control",
-                    description="Stay within your daily carb target",
-                    points=80,
-                    difficulty="hard",
-                    category="diet"
-                )
-            ]
-            recommendations.append(HealthRecommendation(
-                type="diet",
-                priority="high",
-                title="Blood Sugar Control",
-                description="Maintaining healthy blood sugar levels is essential.",
-                impact="Reduces risk of diabetes complications",
-                tasks=tasks,
-                potential_points=120
-            ))
-
-        return recommendations
+    def normalize_scores(self, risk: np.ndarray) -> np.ndarray:
+        """normalize_score over a whole risk matrix."""
+        return np.clip(np.trunc(risk * 100), 0, 100).astype(np.int16)
+
+    def generate_tasks(self, metrics: HealthMetrics, risk_scores: Dict) -> List[Dict]:
+        """Return the read-only recommendation payloads whose rules match."""
+        return recommendation_rules.evaluate(metrics)
+
+    def _run_tflite(self, data: np.ndarray) -> np.ndarray:
+        """Run the TFLite model over N rows, resizing the input tensor per chunk."""
+        interpreter = self.get_interpreter()
+        outputs = []
+        for start in range(0, len(data), TFLITE_MAX_BATCH):
+            chunk = np.float32(data[start:start + TFLITE_MAX_BATCH])
+            if len(chunk) != self._local.batch_size:
+                interpreter.resize_tensor_input(self.input_details[0]['index'], list(chunk.shape))
+                interpreter.allocate_tensors()
+                self._local.batch_size = len(chunk)
+            interpreter.set_tensor(self.input_details[0]['index'], chunk)
+            interpreter.invoke()
+            outputs.append(interpreter.get_tensor(self.output_details[0]['index']).reshape(len(chunk), -1))
+        return np.concatenate(outputs)
+
+    def run_models(self, data: np.ndarray) -> np.ndarray:
+        """Return the combined N x 4 risk matrix for an N x 12 feature matrix."""
+        import xgboost as xgb
+
+        n = len(data)
 
-    async def predict_risk(self, metrics: HealthMetrics) -> Dict:
-        data = self.preprocess_data(metrics)
-        
         # XGBoost prediction
-        xgb_data = xgb.DMatrix(data)
-        xgb_pred = self.xgb_model.predict(xgb_data)
-        
+        with stage("risk.xgboost"):
+            xgb_data = xgb.DMatrix(data)
+            xgb_pred = np.asarray(self.xgb_model.predict(xgb_data)).reshape(n, -1)
+
         # TFLite prediction
-        input_data = np.float32(data)
-        self.interpreter.set_tensor(self.input_details[0]['index'], input_data)
-        self.interpreter.invoke()
-        tflite_pred = self.interpreter.get_tensor(self.output_details[0]['index'])
-        
-        # Combine and normalize predictions
-        final_risk = (xgb_pred + tflite_pred[0]) / 2
-        
+        with stage("risk.tflite"):
+            tflite_pred = self._run_tflite(data)
+
+        # Combine predictions
+        return (xgb_pred + tflite_pred) / 2
+
+    def build_result(self, metrics: HealthMetrics, final_risk: np.ndarray) -> Dict:
         # Calculate health score (inverse of risk)
         overall_health_score = 100 - np.mean([self.normalize_score(r) for r in final_risk])
         
@@ -195,13 +215,30 @@ class RiskPrediction:
             'hypertension': self.normalize_score(final_risk[3])
         }
         
-        recommendations = self.generate_tasks(metrics, risk_categories)
+        with stage("risk.generate_tasks"):
+            recommendations = self.generate_tasks(metrics, risk_categories)
         
         return {
             'health_score': int(overall_health_score),
             'risk_scores': risk_categories,
-            'recommendations': [rec.dict() for rec in recommendations],
-            'total_available_points': sum(rec.potential_points for rec in recommendations)
+            'recommendations': recommendations,
+            'total_available_points': sum(rec['potential_points'] for rec in recommendations),
+            'model_version': self.version
         }
 
-risk_predictor = RiskPrediction() 
\ No newline at end of file
+    def score_batch(self, metrics_list: List[HealthMetrics]) -> List[Dict]:
+        """Score a batch with one XGBoost predict and chunked TFLite invokes."""
+        if not metrics_list:
+            return []
+        with stage("risk.preprocess"):
+            data = self.preprocess_batch(metrics_list)
+        final_risk = self.run_models(data)
+        with stage("risk.build_result"):
+            return [self.build_result(m, row) for m, row in zip(metrics_list, final_risk)]
+
+    async def predict_risk(self, metrics: HealthMetrics) -> Dict:
+        return self.score_batch([metrics])[0]
+
+    async def predict_risk_batch(self, metrics_list: List[HealthMetrics]) -> List[Dict]:
+        return self.score_batch(metrics_list)
+ 
\ No newline at end of file
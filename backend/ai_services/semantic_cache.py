@@ -0,0 +1,119 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Tuple
+import numpy as np
+from ai_services.model_registry import registry
+from ai_services.model_client import get_model_client
+
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+# Cosine similarity above which two questions are treated as the same question
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', '10000'))
+SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', '86400'))
+
+@registry.model("minilm")
+def load_minilm():
+    # Only the process that embeds (the model server, if there is one) pays for torch
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(EMBEDDING_MODEL, device='cpu')
+
+def embed(text: str) -> np.ndarray:
+    client = get_model_client()
+    if client is not None:
+        return client.call("embed", text)
+    return registry.get("minilm").encode(text, normalize_embeddings=True).astype(np.float32)
+
+class SemanticCache:
+    """Answers keyed by question embedding, looked up by cosine similarity.
+
+    The index is a preallocated matrix of unit vectors searched by brute force,
+    which stays well under a millisecond at this capacity. Entries expire after
+    `ttl` seconds; when full, expired entries are reused first, then the least
+    recently used one.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, maxsize: int = SEMANTIC_CACHE_SIZE,
+                 ttl: float | None = SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vectors: np.ndarray | None = None  # allocated once the embedding size is known
+        self._answers: list = [None] * maxsize
+        self._expires = np.full(maxsize, -np.inf)  # -inf marks a free slot
+        self._last_used = np.zeros(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _nearest(self, vector: np.ndarray, now: float) -> Tuple[int, float]:
+        if self._vectors is None:
+            return -1, -1.0
+        scores = self._vectors @ vector
+        scores[self._expires <= now] = -1.0
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    def get(self, vector: np.ndarray) -> str | None:
+        now = time.monotonic()
+        with self._lock:
+            best, score = self._nearest(vector, now)
+            if score >= self.threshold:
+                self._last_used[best] = now
+                self.hits += 1
+                return self._answers[best]
+            self.misses += 1
+            return None
+
+    def set(self, vector: np.ndarray, answer: str):
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            best, score = self._nearest(vector, now)
+            if score >= self.threshold:
+                slot = best  # refresh the equivalent entry instead of storing a near-copy
+            else:
+                expired = np.flatnonzero(self._expires <= now)
+                if len(expired):
+                    slot = int(expired[0])
+                    if self._expires[slot] != -np.inf:
+                        self.evictions += 1
+                else:
+                    slot = int(np.argmin(self._last_used))
+                    self.evictions += 1
+            self._vectors[slot] = vector
+            self._answers[slot] = answer
+            self._expires[slot] = now + self.ttl if self.ttl is not None else np.inf
+            self._last_used[slot] = now
+
+    async def lookup(self, question: str) -> Tuple[str | None, np.ndarray]:
+        """Return (cached answer or None, embedding to pass to set() on a miss)."""
+        vector = await asyncio.to_thread(embed, question)
+        return self.get(vector), vector
+
+    def clear(self):
+        with self._lock:
+            self._expires[:] = -np.inf
+            self._answers = [None] * self.maxsize
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(np.count_nonzero(self._expires > time.monotonic()))
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+semantic_cache = SemanticCache()
@@ -1,37 +1,186 @@
-from transformers import PegasusForConditionalGeneration, PegasusTokenizer
 from fastapi import FastAPI
 from pydantic import BaseModel
-import torch
+from typing import AsyncIterator, Dict
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from ai_services.model_registry import registry
+from ai_services import onnx_export
+from ai_services.metrics import observe_stage, stage
+from ai_services.cache import TTLCache
+from ai_services.model_client import get_model_client
 
-# Load model and tokenizer
 model_name = "google/pegasus-large"
-tokenizer = PegasusTokenizer.from_pretrained(model_name)
-model = PegasusForConditionalGeneration.from_pretrained(model_name)
+
+@registry.model("pegasus")
+def load_pegasus():
+    from transformers import PegasusForConditionalGeneration, PegasusTokenizer
+
+    # Load model and tokenizer
+    tokenizer = PegasusTokenizer.from_pretrained(model_name)
+    model = PegasusForConditionalGeneration.from_pretrained(model_name)
+    return tokenizer, model
+
+def load_pegasus_int8_torch():
+    import torch
+    from transformers import PegasusForConditionalGeneration, PegasusTokenizer
+
+    # Same checkpoint with Linear weights dynamically quantized to int8 for CPU
+    tokenizer = PegasusTokenizer.from_pretrained(model_name)
+    model = PegasusForConditionalGeneration.from_pretrained(model_name)
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return tokenizer, model
+
+@registry.model("pegasus_int8")
+def load_pegasus_int8():
+    # Prefer the int8 ONNX export when one has been built
+    if onnx_export.use_onnx("pegasus"):
+        return onnx_export.load_seq2seq("pegasus")
+    return load_pegasus_int8_torch()
+
+# Finished summaries keyed on a hash of the text and decoding settings
+summary_cache = TTLCache(
+    maxsize=int(os.getenv('SUMMARY_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('SUMMARY_CACHE_TTL', '86400'))
+)
 
 class TextInput(BaseModel):
     text: str
     max_length: int = 150
     min_length: int = 50
+    mode: str = "quality"  # 'quality': beam search, 'fast': greedy decoding on int8 weights
 
-async def generate_summary(text_input: TextInput):
-    # Tokenize the text
-    tokens = tokenizer(text_input.text, truncation=True, padding="longest", return_tensors="pt")
-    
-    # Generate summary
-    summary_ids = model.generate(
-        tokens["input_ids"],
-        num_beams=4,
-        length_penalty=2.0,
-        max_length=text_input.max_length,
-        min_length=text_input.min_length,
-        no_repeat_ngram_size=3
-    )
-    
-    # Decode summary
-    summary = tokenizer.decode(summary_ids[0], skip_special_tokens=True)
-    
+def _decoding(text_input: TextInput, streaming: bool = False) -> Dict:
+    if text_input.mode not in ("quality", "fast"):
+        raise ValueError(f"Unknown summarization mode: {text_input.mode}")
+    fast = text_input.mode == "fast"
+    settings = {
+        "model": "pegasus_int8" if fast else "pegasus",
+        # Streaming can only follow a single hypothesis, so it always decodes greedily
+        "num_beams": 1 if fast or streaming else 4,
+        "max_length": text_input.max_length,
+        "min_length": text_input.min_length,
+        "no_repeat_ngram_size": 3
+    }
+    if settings["num_beams"] > 1:
+        settings["length_penalty"] = 2.0
+    return settings
+
+def _cache_key(text: str, settings: Dict) -> str:
+    payload = json.dumps(settings, sort_keys=True).encode() + b"\0" + text.encode()
+    return hashlib.sha256(payload).hexdigest()
+
+def _result(text_input: TextInput, summary: str) -> Dict:
     return {
         "summary": summary,
         "original_length": len(text_input.text.split()),
         "summary_length": len(summary.split())
-    } 
\ No newline at end of file
+    }
+
+def summarize_sync(text_input: TextInput) -> Dict:
+    client = get_model_client()
+    if client is not None:
+        with stage("summarize.remote"):
+            return client.call("summarize", text_input)
+    settings = _decoding(text_input)
+    key = _cache_key(text_input.text, settings)
+    summary = summary_cache.get(key)
+    if summary is not None:
+        return _result(text_input, summary)
+
+    import torch
+
+    model_key = settings.pop("model")
+    tokenizer, model = registry.get(model_key)
+
+    # Tokenize the text
+    with stage("summarize.tokenize"):
+        tokens = tokenizer(text_input.text, truncation=True, padding="longest", return_tensors="pt")
+
+    # Generate summary
+    with stage(f"summarize.generate.{model_key}"), torch.inference_mode():
+        summary_ids = model.generate(tokens["input_ids"], **settings)
+
+    # Decode summary
+    summary = tokenizer.decode(summary_ids[0], skip_special_tokens=True)
+    summary_cache.set(key, summary)
+
+    return _result(text_input, summary)
+
+async def generate_summary(text_input: TextInput):
+    return await asyncio.to_thread(summarize_sync, text_input)
+
+def _stop_when_set(event: threading.Event):
+    """Stopping criteria that end generation once the consumer of a stream has gone away."""
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class StopWhenSet(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs) -> bool:
+            return event.is_set()
+
+    return StoppingCriteriaList([StopWhenSet()])
+
+async def stream_summary(text_input: TextInput) -> AsyncIterator[str]:
+    """Yield summary text as it is decoded; cached summaries are yielded whole."""
+    client = get_model_client()
+    if client is not None:
+        async for piece in client.astream("summarize.stream", text_input):
+            yield piece
+        return
+    settings = _decoding(text_input, streaming=True)
+    key = _cache_key(text_input.text, settings)
+    summary = summary_cache.get(key)
+    if summary is not None:
+        yield summary
+        return
+
+    import torch
+    from transformers import TextIteratorStreamer
+
+    model_key = settings.pop("model")
+    tokenizer, model = await asyncio.to_thread(registry.get, model_key)
+    tokens = tokenizer(text_input.text, truncation=True, padding="longest", return_tensors="pt")
+
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    cancelled = threading.Event()
+    errors = []
+
+    def run():
+        try:
+            with torch.inference_mode():
+                model.generate(
+                    tokens["input_ids"],
+                    streamer=streamer,
+                    stopping_criteria=_stop_when_set(cancelled),
+                    **settings
+                )
+        except Exception as e:
+            # Unblock the consumer, which re-raises below
+            errors.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=run, name="summary-stream", daemon=True)
+    thread.start()
+
+    pieces = []
+    start = time.perf_counter()
+    try:
+        while True:
+            piece = await asyncio.to_thread(next, streamer, None)
+            if piece is None:
+                break
+            if piece:
+                if not pieces:
+                    observe_stage("summarize.first_token", time.perf_counter() - start)
+                pieces.append(piece)
+                yield piece
+    finally:
+        # Client disconnected or we finished: either way let the generate thread end
+        cancelled.set()
+
+    if errors:
+        raise errors[0]
+    summary_cache.set(key, "".join(pieces).strip())
@@ -0,0 +1,273 @@
+"""Per-user history of health metrics and risk scores, with incremental trends.
+
+Every user gets a directory of column files under TIMESERIES_DIR, one flat
+array per field:
+
+    data/timeseries/<user hash>/timestamp.f8
+    data/timeseries/<user hash>/blood_sugar.f4
+    ...
+
+Recording a point writes one value at the end of each column. The timestamp
+column is written last and defines the row count, so a crash part-way through
+a write leaves a stray value that the next write overwrites. History reads
+are slices of memory-mapped columns. Trends (EWMA, min/max and least-squares
+slopes over the last few points) are updated with each write, so a trend
+query does not rescan the history.
+
+Writers hold an flock on the user's lock file and take the row count from
+disk, so several API workers can record for the same user. Each process
+applies the rows others wrote before its next write or read.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Dict
+import numpy as np
+from ai_services.risk_prediction_service import FEATURE_FIELDS, RISK_CATEGORIES, HealthMetrics
+from ai_services.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+TIMESERIES_DIR = os.getenv('TIMESERIES_DIR', 'data/timeseries')
+# Users whose aggregates are kept in memory; others are rebuilt from disk on next use
+TIMESERIES_MAX_USERS = int(os.getenv('TIMESERIES_MAX_USERS', '1024'))
+# Number of most recent points each slope is fitted over
+TREND_WINDOWS = tuple(int(w) for w in os.getenv('TREND_WINDOWS', '5,20').split(','))
+TREND_EWMA_ALPHA = float(os.getenv('TREND_EWMA_ALPHA', '0.3'))
+
+METRIC_FIELDS = FEATURE_FIELDS
+RISK_FIELDS = RISK_CATEGORIES
+SERIES = METRIC_FIELDS + ('health_score',) + RISK_FIELDS
+
+TIMESTAMP_DTYPE = np.dtype('<f8')
+VALUE_DTYPE = np.dtype('<f4')
+SECONDS_PER_DAY = 86400.0
+
+def _column_file(name: str, dtype: np.dtype) -> str:
+    return f"{name}.{dtype.kind}{dtype.itemsize}"
+
+TIMESTAMP_FILE = _column_file('timestamp', TIMESTAMP_DTYPE)
+LOCK_FILE = '.lock'
+SERIES_FILES = [_column_file(name, VALUE_DTYPE) for name in SERIES]
+
+def _row(metrics: HealthMetrics, result: Dict) -> np.ndarray:
+    values = metrics.dict()
+    values['gender'] = 1 if metrics.gender.lower() == 'male' else 0
+    values['smoking'] = 1 if metrics.smoking else 0
+    values['health_score'] = result['health_score']
+    values.update(result['risk_scores'])
+    return np.array([values[name] for name in SERIES], dtype=np.float64)
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+def _round(value: float | None) -> float | None:
+    return None if value is None else round(float(value), 4)
+
+class _Window:
+    """Running least-squares sums over the last `size` points (x in days)."""
+
+    def __init__(self, size: int, series: int):
+        self.size = size
+        self.n = 0
+        self.sx = 0.0
+        self.sxx = 0.0
+        self.sy = np.zeros(series)
+        self.sxy = np.zeros(series)
+
+    def add(self, x: float, y: np.ndarray, sign: int = 1):
+        self.n += sign
+        self.sx += sign * x
+        self.sxx += sign * x * x
+        self.sy += sign * y
+        self.sxy += sign * x * y
+
+    def slopes(self) -> np.ndarray | None:
+        """Change per day of every series, None with fewer than two distinct times."""
+        denominator = self.n * self.sxx - self.sx * self.sx
+        if self.n < 2 or denominator <= 1e-12 * max(1.0, self.sxx):
+            return None
+        return (self.n * self.sxy - self.sx * self.sy) / denominator
+
+class UserSeries:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.windows = [_Window(size, len(SERIES)) for size in TREND_WINDOWS]
+        # Points still inside the largest window, so they can be subtracted when they leave it
+        self._tail = deque(maxlen=max(TREND_WINDOWS))
+        self.count = 0
+        self.first = self.last_timestamp = None
+        self.latest = self.previous = self.ewma = None
+        self.min = self.max = None
+        # Rebuild the aggregates from the columns; the only full scan of a user's history
+        self.sync()
+
+    def _column(self, filename: str, dtype: np.dtype, count: int, mmap: bool = True) -> np.ndarray:
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        path = os.path.join(self.path, filename)
+        if mmap:
+            return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+        return np.fromfile(path, dtype=dtype, count=count)
+
+    def _rows_on_disk(self) -> int:
+        try:
+            return os.path.getsize(os.path.join(self.path, TIMESTAMP_FILE)) // TIMESTAMP_DTYPE.itemsize
+        except FileNotFoundError:
+            return 0
+
+    def sync(self):
+        """Apply rows appended on disk since we last looked (by another process or an evicted copy)."""
+        count = self._rows_on_disk()
+        if count <= self.count:
+            return
+
+        def read(filename: str, dtype: np.dtype) -> np.ndarray:
+            return np.fromfile(os.path.join(self.path, filename), dtype=dtype,
+                               count=count - self.count, offset=self.count * dtype.itemsize)
+
+        timestamps = read(TIMESTAMP_FILE, TIMESTAMP_DTYPE)
+        values = np.stack([read(f, VALUE_DTYPE) for f in SERIES_FILES], axis=1).astype(np.float64)
+        for timestamp, row in zip(timestamps, values):
+            self._update(float(timestamp), row)
+
+    def _update(self, timestamp: float, row: np.ndarray):
+        if self.count == 0:
+            self.first = timestamp
+            self.ewma, self.min, self.max = row.copy(), row.copy(), row.copy()
+        else:
+            self.ewma += TREND_EWMA_ALPHA * (row - self.ewma)
+            np.minimum(self.min, row, out=self.min)
+            np.maximum(self.max, row, out=self.max)
+        self.previous, self.latest = self.latest, row
+        self.last_timestamp = timestamp
+        self.count += 1
+
+        x = (timestamp - self.first) / SECONDS_PER_DAY
+        for window in self.windows:
+            if window.n == window.size:
+                old_x, old_y = self._tail[-window.size]
+                window.add(old_x, old_y, -1)
+            window.add(x, row)
+        self._tail.append((x, row))
+
+    def append(self, timestamp: float, row: np.ndarray):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_FILE), 'a') as lock:
+            # Held until the file is closed; other writers of this user wait here
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Catch up first so our row goes after theirs and the trends include them
+            self.sync()
+            # Never go back in time, so the timestamp column stays sorted for range queries
+            if self.last_timestamp is not None:
+                timestamp = max(timestamp, self.last_timestamp)
+            columns = [(f, VALUE_DTYPE, value) for f, value in zip(SERIES_FILES, row)]
+            columns.append((TIMESTAMP_FILE, TIMESTAMP_DTYPE, timestamp))
+            for filename, dtype, value in columns:
+                fd = os.open(os.path.join(self.path, filename), os.O_WRONLY | os.O_CREAT, 0o644)
+                try:
+                    os.pwrite(fd, np.array([value], dtype=dtype).tobytes(), self.count * dtype.itemsize)
+                finally:
+                    os.close(fd)
+            # Trends use the stored (float32) values so they match a rebuild from disk
+            self._update(timestamp, row.astype(VALUE_DTYPE).astype(np.float64))
+
+    def history(self, limit: int, since: float | None) -> Dict[str, np.ndarray]:
+        timestamps = self._column(TIMESTAMP_FILE, TIMESTAMP_DTYPE, self.count)
+        start = max(0, self.count - limit)
+        if since is not None:
+            start = max(start, int(np.searchsorted(timestamps, since, side='left')))
+        columns = {'timestamp': np.array(timestamps[start:])}
+        for name, filename in zip(SERIES, SERIES_FILES):
+            columns[name] = np.array(self._column(filename, VALUE_DTYPE, self.count)[start:])
+        return columns
+
+    def trends(self) -> Dict:
+        slopes = [window.slopes() for window in self.windows]
+        series = {}
+        for i, name in enumerate(SERIES):
+            previous = None if self.previous is None else self.previous[i]
+            series[name] = {
+                "latest": _round(self.latest[i]),
+                "delta": None if previous is None else _round(self.latest[i] - previous),
+                "ewma": _round(self.ewma[i]),
+                "min": _round(self.min[i]),
+                "max": _round(self.max[i]),
+                "slope_per_day": {
+                    str(window.size): None if s is None else _round(s[i])
+                    for window, s in zip(self.windows, slopes)
+                }
+            }
+        return {
+            "points": self.count,
+            "first": _isoformat(self.first),
+            "last": _isoformat(self.last_timestamp),
+            "series": series
+        }
+
+class TimeSeriesStore:
+    def __init__(self, root: str = TIMESERIES_DIR, max_users: int = TIMESERIES_MAX_USERS):
+        self.root = root
+        self.max_users = max_users
+        self._users: "OrderedDict[str, UserSeries]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def user_dir(self, user_id: str) -> str:
+        # Hashed so any user id is a safe directory name
+        return os.path.join(self.root, hashlib.blake2b(user_id.encode(), digest_size=16).hexdigest())
+
+    def _series(self, user_id: str) -> UserSeries:
+        with self._lock:
+            series = self._users.get(user_id)
+            if series is not None:
+                self._users.move_to_end(user_id)
+                return series
+        # Load outside the store lock; a concurrent load of the same user just loses the race
+        loaded = UserSeries(self.user_dir(user_id))
+        with self._lock:
+            series = self._users.setdefault(user_id, loaded)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return series
+
+    def record(self, user_id: str, metrics: HealthMetrics, result: Dict, timestamp: float | None = None):
+        """Append one scored set of metrics to the user's history."""
+        with stage("timeseries.record"):
+            series = self._series(user_id)
+            with series.lock:
+                series.append(time.time() if timestamp is None else timestamp, _row(metrics, result))
+
+    def history(self, user_id: str, limit: int = 100, since: float | None = None) -> Dict:
+        """The user's most recent points (oldest first), optionally only those at or after `since`."""
+        series = self._series(user_id)
+        with series.lock:
+            series.sync()
+            columns = series.history(limit, since)
+        return {
+            "points": len(columns['timestamp']),
+            "timestamps": [_isoformat(t) for t in columns['timestamp']],
+            "health_score": columns['health_score'].astype(int).tolist(),
+            "risk_scores": {name: columns[name].astype(int).tolist() for name in RISK_FIELDS},
+            "metrics": {name: np.round(columns[name], 4).tolist() for name in METRIC_FIELDS}
+        }
+
+    def trends(self, user_id: str) -> Dict | None:
+        """Latest value, change since the previous point, EWMA, range and slopes per series."""
+        series = self._series(user_id)
+        with series.lock:
+            series.sync()
+            if series.count == 0:
+                return None
+            return series.trends()
+
+    def stats(self) -> Dict:
+        return {"root": self.root, "users_loaded": len(self._users), "windows": list(TREND_WINDOWS)}
+
+timeseries_store = TimeSeriesStore()
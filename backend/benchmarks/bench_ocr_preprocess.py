@@ -0,0 +1,54 @@
+"""Check that OCR preprocessing keeps every glyph, then time it.
+
+Lab values live in small glyphs ("5.6", "7,2"), so the noise filter must
+never take a full stop or comma for a speck. Run from the backend directory:
+
+    python -m benchmarks.bench_ocr_preprocess --iterations 50
+"""
+import argparse
+import random
+import time
+import cv2
+import numpy as np
+from ai_services.ocr_service import preprocess_image
+from benchmarks.fixtures import lab_report_image
+
+LAB_VALUE_TEXT = "HbA1c 5.6 %, 7.2"
+# (font scale, thickness) from the lab report fixture's print size up to headings; below
+# that the 3x3 dilation itself erases 1-2 pixel strokes, noise filter or not
+TEXT_SIZES = [(1.0, 2), (1.2, 2), (1.5, 2), (2.0, 3), (3.0, 4)]
+
+def check_glyphs_survive(text: str, scale: float, thickness: int):
+    image = np.full((int(60 * scale) + 40, int(30 * scale * len(text)) + 20), 255, dtype=np.uint8)
+    cv2.putText(image, text, (10, int(40 * scale) + 10), cv2.FONT_HERSHEY_SIMPLEX, scale, 0, thickness, cv2.LINE_AA)
+    thresh = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    count, labels = cv2.connectedComponents(cv2.bitwise_not(thresh), connectivity=8)
+    processed = preprocess_image(cv2.cvtColor(image, cv2.COLOR_GRAY2BGR))
+    # Every glyph component (including each full stop and comma) must keep some ink
+    kept = np.unique(labels[processed == 0])
+    missing = count - 1 - np.count_nonzero(kept)
+    assert missing == 0, f"{missing} of {count - 1} glyphs of {text!r} lost at scale {scale}, thickness {thickness}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for scale, thickness in TEXT_SIZES:
+        check_glyphs_survive(LAB_VALUE_TEXT, scale, thickness)
+
+    rng = random.Random(args.seed)
+    images = [cv2.imdecode(np.frombuffer(lab_report_image(rng), np.uint8), cv2.IMREAD_COLOR)
+              for _ in range(args.iterations)]
+    start = time.perf_counter()
+    for image in images:
+        preprocess_image(image)
+    elapsed = time.perf_counter() - start
+
+    print(f"glyph checks:      {len(TEXT_SIZES)} text sizes passed")
+    print(f"iterations:        {args.iterations}")
+    print(f"preprocess_image:  {elapsed * 1e3 / args.iterations:8.2f} ms/page")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Check that the int8 ONNX exports match PyTorch, and compare their latency.
+
+Build the exports first, then run from the backend directory:
+
+    python -m ai_services.onnx_export
+    python -m benchmarks.bench_onnx --samples 20
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+import torch
+from ai_services import onnx_export
+from ai_services.ner_service import load_biobert_torch
+from ai_services.summarization_service import load_pegasus
+from benchmarks.fixtures import synthetic_report
+
+def timed(fn: Callable, inputs: List) -> List[float]:
+    timings = []
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def latency(timings: List[float]) -> Dict:
+    ordered = sorted(timings)
+    return {
+        "mean_ms": round(statistics.mean(ordered) * 1000, 2),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+    }
+
+def lcs_f1(a: str, b: str) -> float:
+    """ROUGE-L style F1 between two strings, on whitespace tokens."""
+    x, y = a.split(), b.split()
+    if not x or not y:
+        return float(x == y)
+    row = [0] * (len(y) + 1)
+    for i in range(len(x)):
+        previous = 0
+        for j in range(len(y)):
+            current = row[j + 1]
+            row[j + 1] = previous + 1 if x[i] == y[j] else max(row[j + 1], row[j])
+            previous = current
+    lcs = row[-1]
+    if lcs == 0:
+        return 0.0
+    precision, recall = lcs / len(x), lcs / len(y)
+    return 2 * precision * recall / (precision + recall)
+
+def bench_biobert(texts: List[str]) -> Dict:
+    tokenizer, torch_model = load_biobert_torch()
+    _, onnx_model = onnx_export.load_token_classifier("biobert")
+
+    def labels(model, text):
+        batch = tokenizer(text, truncation=True, max_length=512, return_tensors="pt")
+        with torch.inference_mode():
+            return torch.argmax(model(**batch).logits, dim=2)[0].tolist()
+
+    agree = total = exact = 0
+    for text in texts:
+        expected, actual = labels(torch_model, text), labels(onnx_model, text)
+        agree += sum(e == a for e, a in zip(expected, actual))
+        total += len(expected)
+        exact += expected == actual
+
+    return {
+        "token_label_agreement": round(agree / total, 4),
+        "identical_documents": round(exact / len(texts), 4),
+        "pytorch": latency(timed(lambda t: labels(torch_model, t), texts)),
+        "onnx_int8": latency(timed(lambda t: labels(onnx_model, t), texts)),
+    }
+
+def bench_pegasus(texts: List[str], max_length: int) -> Dict:
+    tokenizer, torch_model = load_pegasus()
+    _, onnx_model = onnx_export.load_seq2seq("pegasus")
+
+    def summarize(model, text):
+        tokens = tokenizer(text, truncation=True, return_tensors="pt")
+        with torch.inference_mode():
+            ids = model.generate(tokens["input_ids"], num_beams=1, max_length=max_length, no_repeat_ngram_size=3)
+        return tokenizer.decode(ids[0], skip_special_tokens=True)
+
+    scores = [lcs_f1(summarize(torch_model, t), summarize(onnx_model, t)) for t in texts]
+    return {
+        "rouge_l_vs_pytorch": round(statistics.mean(scores), 4),
+        "min_rouge_l": round(min(scores), 4),
+        "pytorch": latency(timed(lambda t: summarize(torch_model, t), texts)),
+        "onnx_int8": latency(timed(lambda t: summarize(onnx_model, t), texts)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models', nargs='+', default=['biobert', 'pegasus'])
+    parser.add_argument('--samples', type=int, default=20)
+    parser.add_argument('--sentences', type=int, default=12)
+    parser.add_argument('--summary-length', type=int, default=64)
+    parser.add_argument('--min-agreement', type=float, default=0.98,
+                        help='fail if BioBERT token agreement drops below this')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = [synthetic_report(rng, args.sentences) for _ in range(args.samples)]
+
+    report = {}
+    for name in args.models:
+        if not onnx_export.is_exported(name):
+            raise SystemExit(f"No ONNX export for '{name}'; run python -m ai_services.onnx_export {name}")
+        if name == 'biobert':
+            report[name] = bench_biobert(texts)
+        else:
+            report[name] = bench_pegasus(texts, args.summary_length)
+    print(json.dumps(report, indent=2))
+
+    if 'biobert' in report and report['biobert']['token_label_agreement'] < args.min_agreement:
+        raise SystemExit("BioBERT ONNX export disagrees with PyTorch beyond the allowed margin")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Compare the compiled recommendation rules with the original if-chain.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_recommendation_rules --iterations 20000
+"""
+import argparse
+import json
+import random
+import time
+from typing import Dict, List
+from ai_services.risk_prediction_service import HealthMetrics, HealthRecommendation, Task, recommendation_rules
+from benchmarks.fixtures import random_metrics
+
+def legacy_generate_tasks(metrics: HealthMetrics) -> List[HealthRecommendation]:
+    """The hard-coded implementation the rule table replaced, kept as a baseline."""
+    recommendations = []
+
+    if metrics.physical_activity_hours < 3:
+        tasks = [
+            Task(id="exercise_1", title="Daily Walk", description="Take a 30-minute walk today",
+                 points=50, difficulty="easy", category="exercise"),
+            Task(id="exercise_2", title="Strength Training",
+                 description="Complete 15 minutes of basic strength exercises",
+                 points=75, difficulty="medium", category="exercise")
+        ]
+        recommendations.append(HealthRecommendation(
+            type="exercise",
+            priority="high",
+            title="Increase Physical Activity",
+            description="Regular exercise helps improve overall health and reduce health risks.",
+            impact="Reduces risk of heart disease and improves fitness",
+            tasks=tasks,
+            potential_points=125
+        ))
+
+    if metrics.blood_pressure_systolic > 140 or metrics.blood_pressure_diastolic > 90:
+        tasks = [
+            Task(id="bp_1", title="BP Monitoring", description="Record your blood pressure twice today",
+                 points=30, difficulty="easy", category="medical"),
+            Task(id="bp_2", title="Salt Reduction", description="Keep sodium intake under 2000mg today",
+                 points=60, difficulty="medium", category="diet")
+        ]
+        recommendations.append(HealthRecommendation(
+            type="lifestyle",
+            priority="high",
+            title="Blood Pressure Management",
+            description="Managing blood pressure is crucial for heart health.",
+            impact="Reduces risk of cardiovascular complications",
+            tasks=tasks,
+            potential_points=90
+        ))
+
+    if metrics.blood_sugar > 100:
+        tasks = [
+            Task(id="sugar_1", title="Glucose Check", description="Check blood sugar before and after meals",
+                 points=40, difficulty="easy", category="medical"),
+            Task(id="sugar_2", title="Carb Control", description="Stay within your daily carb target",
+                 points=80, difficulty="hard", category="diet")
+        ]
+        recommendations.append(HealthRecommendation(
+            type="diet",
+            priority="high",
+            title="Blood Sugar Control",
+            description="Maintaining healthy blood sugar levels is essential.",
+            impact="Reduces risk of diabetes complications",
+            tasks=tasks,
+            potential_points=120
+        ))
+
+    return recommendations
+
+def legacy(metrics: HealthMetrics) -> Dict:
+    recommendations = legacy_generate_tasks(metrics)
+    return {
+        'recommendations': [rec.dict() for rec in recommendations],
+        'total_available_points': sum(rec.potential_points for rec in recommendations)
+    }
+
+def compiled(metrics: HealthMetrics) -> Dict:
+    recommendations = recommendation_rules.evaluate(metrics)
+    return {
+        'recommendations': recommendations,
+        'total_available_points': sum(rec['potential_points'] for rec in recommendations)
+    }
+
+def bench(fn, samples: List[HealthMetrics]) -> float:
+    start = time.perf_counter()
+    for metrics in samples:
+        fn(metrics)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    samples = [random_metrics(rng) for _ in range(args.iterations)]
+
+    # Both implementations must agree before their timings mean anything
+    for metrics in samples[:1000]:
+        expected, actual = legacy(metrics), compiled(metrics)
+        assert json.dumps(expected) == json.dumps(actual), f"Output mismatch for {metrics}"
+
+    legacy_time = bench(legacy, samples)
+    compiled_time = bench(compiled, samples)
+
+    print(f"iterations:        {args.iterations}")
+    print(f"legacy if-chain:   {legacy_time * 1e6 / args.iterations:8.2f} us/call")
+    print(f"compiled rules:    {compiled_time * 1e6 / args.iterations:8.2f} us/call")
+    print(f"speedup:           {legacy_time / compiled_time:8.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Throughput, latency percentiles and peak RSS for every AI service.
+
+Each service is driven with synthetic inputs at several concurrency levels,
+both by calling the service directly ("inprocess") and through the FastAPI
+app with a test client ("api"). Run from the backend directory:
+
+    python -m benchmarks.bench_services --services risk topic --concurrency 1 8 32 --output run.json
+    python -m benchmarks.bench_services --baseline run.json   # also prints the change per result
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import platform
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+from benchmarks.fixtures import lab_report_image, random_metrics, synthetic_message, synthetic_report
+
+class Service(NamedTuple):
+    make_input: Callable[[random.Random], Any]
+    call: Callable[[Any], Awaitable]  # in-process coroutine
+    request: Optional[Callable[[Any], Dict]]  # TestClient.post kwargs, None if the service has no route
+
+def _risk():
+    from ai_services.model_versions import get_risk_predictor
+
+    return Service(
+        random_metrics,
+        lambda metrics: get_risk_predictor().predict_risk(metrics),
+        lambda metrics: {"url": "/api/predict-risk", "json": metrics.dict()}
+    )
+
+def _ocr():
+    from fastapi import UploadFile
+    from ai_services.ocr_service import process_image
+
+    return Service(
+        lab_report_image,
+        lambda image: process_image(UploadFile(file=io.BytesIO(image), filename="report.png")),
+        lambda image: {"url": "/api/ocr", "files": {"file": ("report.png", image, "image/png")}}
+    )
+
+def _ner():
+    from ai_services.ner_service import TextInput, extract_entities
+
+    return Service(synthetic_report, lambda text: extract_entities(TextInput(text=text)), None)
+
+def _summarize(mode: str):
+    from ai_services.summarization_service import TextInput, generate_summary
+
+    return Service(
+        synthetic_report,
+        lambda text: generate_summary(TextInput(text=text, mode=mode)),
+        lambda text: {"url": "/api/summarize", "json": {"text": text, "mode": mode}}
+    )
+
+def _topic():
+    from ai_services.local_chatbot_service import local_chatbot
+
+    async def classify(message):
+        return local_chatbot._get_topic(message)
+
+    return Service(synthetic_message, classify, None)
+
+SERVICES = {
+    "risk": _risk,
+    "ocr": _ocr,
+    "ner": _ner,
+    "summarize": lambda: _summarize("quality"),
+    "summarize_fast": lambda: _summarize("fast"),
+    "topic": _topic,
+}
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS; children only count once they exit
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return round((own + children) / 2**20, 1)
+
+def summarize_run(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float | None:
+        if not ordered:
+            return None
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2)
+
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round((len(ordered) - errors) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+async def run_inprocess(service: Service, inputs: List, concurrency: int) -> Dict:
+    pending = iter(inputs)
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        for item in pending:
+            start = time.perf_counter()
+            try:
+                await service.call(item)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize_run(latencies, errors, time.perf_counter() - start)
+
+def run_api(client, service: Service, inputs: List, concurrency: int) -> Dict:
+    def send(item):
+        start = time.perf_counter()
+        try:
+            ok = client.post(**service.request(item)).status_code < 400
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(send, inputs))
+    elapsed = time.perf_counter() - start
+    return summarize_run([t for t, _ in outcomes], sum(not ok for _, ok in outcomes), elapsed)
+
+def compare(results: List[Dict], baseline: List[Dict]):
+    """Print throughput and p95 change against a previous run to stderr."""
+    previous = {(r["service"], r["mode"], r["concurrency"]): r for r in baseline}
+    for r in results:
+        old = previous.get((r["service"], r["mode"], r["concurrency"]))
+        if old is None or not old["throughput_rps"] or not old["p95_ms"] or not r["p95_ms"]:
+            continue
+        throughput = (r["throughput_rps"] / old["throughput_rps"] - 1) * 100
+        p95 = (r["p95_ms"] / old["p95_ms"] - 1) * 100
+        print(f"{r['service']:>15} {r['mode']:>9} c={r['concurrency']:<4} "
+              f"throughput {throughput:+7.1f}%   p95 {p95:+7.1f}%", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--services', nargs='+', default=list(SERVICES), choices=list(SERVICES))
+    parser.add_argument('--modes', nargs='+', default=['inprocess', 'api'], choices=['inprocess', 'api'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=50, help='requests per service, mode and concurrency level')
+    parser.add_argument('--warmup', type=int, default=2, help='unmeasured requests before each service')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    parser.add_argument('--baseline', help='JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    rng = random.Random(args.seed)
+    services = {name: SERVICES[name]() for name in args.services}
+    results = []
+
+    def record(name: str, mode: str, concurrency: int, stats: Dict):
+        results.append({"service": name, "mode": mode, "concurrency": concurrency, **stats})
+        print(f"{name:>15} {mode:>9} c={concurrency:<4} {stats['throughput_rps']:>9.1f} req/s  "
+              f"p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  p99 {stats['p99_ms']} ms", file=sys.stderr)
+
+    if 'inprocess' in args.modes:
+        async def run_all():
+            for name, service in services.items():
+                # Fresh inputs for every level so result caches don't flatter the numbers
+                await run_inprocess(service, [service.make_input(rng) for _ in range(args.warmup)], 1)
+                for concurrency in args.concurrency:
+                    inputs = [service.make_input(rng) for _ in range(args.requests)]
+                    record(name, 'inprocess', concurrency, await run_inprocess(service, inputs, concurrency))
+        asyncio.run(run_all())
+
+    if 'api' in args.modes:
+        from fastapi.testclient import TestClient
+        from main import app
+
+        with TestClient(app) as client:
+            for name, service in services.items():
+                if service.request is None:
+                    print(f"{name:>15} {'api':>9} skipped: no HTTP route", file=sys.stderr)
+                    continue
+                run_api(client, service, [service.make_input(rng) for _ in range(args.warmup)], 1)
+                for concurrency in args.concurrency:
+                    inputs = [service.make_input(rng) for _ in range(args.requests)]
+                    record(name, 'api', concurrency, run_api(client, service, inputs, concurrency))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "seed": args.seed,
+            "requests": args.requests
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f)["results"])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Synthetic inputs shared by the benchmarks."""
+import random
+from typing import List
+import cv2
+import numpy as np
+from ai_services.risk_prediction_service import HealthMetrics
+
+FINDINGS = [
+    "Patient presents with {} and a history of {}.",
+    "Labs show elevated {}; started on {} {} mg daily.",
+    "No evidence of {} on imaging. Continue {} and recheck in {} weeks.",
+    "Family history notable for {}. Denies {}.",
+]
+TERMS = [
+    "type 2 diabetes", "hypertension", "hyperlipidemia", "atrial fibrillation", "chest pain",
+    "metformin", "lisinopril", "atorvastatin", "HbA1c", "LDL cholesterol", "creatinine",
+    "pneumonia", "asthma", "chronic kidney disease", "shortness of breath", "warfarin",
+]
+LAB_TESTS = ["Glucose", "HbA1c", "LDL", "HDL", "Triglycerides", "Creatinine", "Sodium", "Potassium"]
+CHAT_MESSAGES = [
+    "hello there", "Hi, how are you?", "What is a normal blood pressure?", "my bp was 150/95 this morning",
+    "how much exercise should I get each week", "any tips for a workout routine?", "what should I eat for breakfast",
+    "is a keto diet healthy", "I can't sleep at night", "always tired after lunch", "work stress is getting to me",
+    "I feel anxious all the time", "what does my cholesterol number mean", "thanks for the help",
+    "can you explain my lab results", "I've been running every day this month",
+]
+
+def random_metrics(rng: random.Random) -> HealthMetrics:
+    return HealthMetrics(
+        age=rng.randint(18, 90),
+        gender=rng.choice(['male', 'female']),
+        height=rng.uniform(150, 200),
+        weight=rng.uniform(45, 130),
+        blood_pressure_systolic=rng.uniform(95, 180),
+        blood_pressure_diastolic=rng.uniform(60, 110),
+        heart_rate=rng.uniform(50, 110),
+        blood_sugar=rng.uniform(70, 180),
+        cholesterol=rng.uniform(140, 300),
+        smoking=rng.random() < 0.2,
+        alcohol_consumption=rng.uniform(0, 14),
+        physical_activity_hours=rng.uniform(0, 10)
+    )
+
+def synthetic_report(rng: random.Random, sentences: int = 12) -> str:
+    parts = []
+    for _ in range(sentences):
+        template = rng.choice(FINDINGS)
+        parts.append(template.format(*[rng.choice(TERMS) if i < 2 else rng.randint(1, 12)
+                                       for i in range(template.count("{}"))]))
+    return " ".join(parts)
+
+def synthetic_message(rng: random.Random) -> str:
+    return rng.choice(CHAT_MESSAGES)
+
+def lab_report_lines(rng: random.Random, rows: int = 10) -> List[str]:
+    lines = ["LABORATORY REPORT", f"Patient ID: {rng.randint(100000, 999999)}"]
+    for _ in range(rows):
+        lines.append(f"{rng.choice(LAB_TESTS)}: {rng.uniform(1, 250):.1f}")
+    return lines
+
+def lab_report_image(rng: random.Random, rows: int = 10, width: int = 1240) -> bytes:
+    """PNG of a printed lab report; random values keep the OCR cache from answering."""
+    lines = lab_report_lines(rng, rows)
+    line_height = 48
+    image = np.full((line_height * (len(lines) + 2), width), 255, dtype=np.uint8)
+    for i, line in enumerate(lines, start=1):
+        cv2.putText(image, line, (60, line_height * i + 20), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2, cv2.LINE_AA)
+    # A little sensor noise so preprocessing has something to do
+    noise = np.random.default_rng(rng.randint(0, 2**32 - 1)).integers(0, 20, image.shape, dtype=np.uint8)
+    image = cv2.subtract(image, noise)
+    return cv2.imencode('.png', image)[1].tobytes()
@@ -1,8 +1,42 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException, File, Form, Header, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from ai_services.risk_prediction_service import RiskPrediction, HealthMetrics
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Match
+from pydantic import ValidationError
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import base64
+import json
+import logging
+import os
+import secrets
+import time
+from ai_services.risk_prediction_service import HealthMetrics, prediction_cache, metrics_cache_key
+from ai_services.inference_executor import InferenceExecutor, QueueFullError
+from ai_services.batching import MicroBatcher
+from ai_services.model_registry import registry
+from ai_services.model_versions import model_versions
+from ai_services.model_client import get_model_client
+from ai_services.ocr_service import process_image, process_document, document_jobs, shutdown_ocr_pool
+from ai_services.report_pipeline import analyze_document, analyze_text, shutdown_report_pools
+from ai_services.job_broker import FINISHED, get_broker
+from ai_services.jobs import JOBS_INPROCESS_WORKERS, JOB_POLL_SECONDS, JobRequest, JobWorker, submit_job
+from ai_services.ocr_store import ocr_writer, get_history
+from ai_services.timeseries_store import timeseries_store
+from ai_services.ocr_cache import ocr_cache
+from ai_services.summarization_service import TextInput as SummaryInput, generate_summary, stream_summary
+from ai_services.chatbot_service import ChatInput, chatbot
+from ai_services.openai_client import close_openai_client
+from ai_services.semantic_cache import semantic_cache
+from ai_services import metrics, profiler
 
-app = FastAPI()
+async def tag_route(request: Request):
+    # Lets the sampling profiler attribute event loop samples to this route
+    profiler.tag_current_task(request.scope["route"].path)
+
+app = FastAPI(dependencies=[Depends(tag_route)])
+logger = logging.getLogger(__name__)
 
 # Add CORS middleware
 app.add_middleware(
@@ -13,12 +47,458 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-risk_predictor = RiskPrediction()
+# Model inference runs on a worker pool so it never blocks the event loop
+inference_executor = InferenceExecutor()
+
+# Coalesce concurrent single predictions into one vectorized batch per model version
+RISK_BATCHING = os.getenv('RISK_BATCHING', '1') == '1'
+risk_batcher = MicroBatcher(
+    inference_executor.predict_versioned,
+    max_batch_size=int(os.getenv('RISK_BATCH_MAX_SIZE', '32')),
+    max_wait_ms=float(os.getenv('RISK_BATCH_MAX_WAIT_MS', '5'))
+)
+# Largest body accepted by /api/predict-risk/batch
+RISK_BATCH_MAX_ITEMS = int(os.getenv('RISK_BATCH_MAX_ITEMS', '1000'))
+
+def versioned_key(version: str | None, key: str) -> str:
+    # Scores from different model versions must never be served for each other
+    return f"{version}:{key}"
+
+def queue_full_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Risk prediction is at capacity, please retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
+# Extra registered models to load in parallel at startup (comma separated, or "all")
+WARM_MODELS = [m.strip() for m in os.getenv('WARM_MODELS', '').split(',') if m.strip()]
+
+async def warm_models():
+    # A model server warms its own models
+    if WARM_MODELS and get_model_client() is None:
+        names = None if WARM_MODELS == ['all'] else WARM_MODELS
+        await asyncio.to_thread(registry.warm, names)
+    await inference_executor.warm()
+
+# (method, path) -> template for routes without path parameters; at most one entry per route and method
+_static_routes: Dict[Tuple[str, str], str] = {}
+
+def route_template(method: str, path: str) -> str:
+    """Path template of the matching route, so /api/ocr/history/{user_id} is one series.
+
+    Paths with parameters (ids) and unmatched paths are looked up every time:
+    caching them would grow with every id seen.
+    """
+    template = _static_routes.get((method, path))
+    if template is not None:
+        return template
+    scope = {"type": "http", "method": method, "path": path}
+    for route in app.router.routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            if not child_scope.get("path_params"):
+                _static_routes[(method, path)] = route.path
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    if not metrics.METRICS_ENABLED:
+        return await call_next(request)
+    method = request.method
+    route = route_template(method, request.scope["path"])
+    request.state.received_at = time.perf_counter()
+    metrics.requests_in_flight.inc(method, route)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.requests_in_flight.dec(method, route)
+        # For streaming responses this is time to the first byte
+        metrics.request_seconds.observe(time.perf_counter() - request.state.received_at, method, route, status)
+
+def service_metrics() -> List[str]:
+    lines = [
+        "# HELP model_load_seconds Time taken to load each model",
+        "# TYPE model_load_seconds gauge"
+    ]
+    for name, status in registry.status().items():
+        if status["load_seconds"] is not None:
+            lines.append(f'model_load_seconds{{model="{name}"}} {status["load_seconds"]}')
+    lines += [
+        "# HELP inference_pending Risk predictions running or waiting for a worker",
+        "# TYPE inference_pending gauge",
+        f"inference_pending {inference_executor.pending}",
+        "# HELP ocr_write_queue_depth OCR results waiting to be written",
+        "# TYPE ocr_write_queue_depth gauge",
+        f"ocr_write_queue_depth {ocr_writer.stats()['queued']}"
+    ]
+    return lines
+
+metrics.register_collector(service_metrics)
+
+@app.on_event("startup")
+async def startup():
+    # Warm in the background so the server (and "/") comes up immediately
+    app.state.warmup = asyncio.create_task(warm_models())
+    model_versions.start_watching()
+    app.state.job_worker = None
+    if JOBS_INPROCESS_WORKERS > 0:
+        app.state.job_worker = JobWorker(concurrency=JOBS_INPROCESS_WORKERS, name=f"api:{os.getpid()}")
+        app.state.job_worker.start()
+    try:
+        await ocr_writer.start()
+    except Exception as e:
+        # OCR still works without a database, results just aren't stored
+        logger.error(f"OCR result persistence unavailable: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.warmup.cancel()
+    await asyncio.to_thread(model_versions.stop_watching)
+    if app.state.job_worker is not None:
+        # Running jobs are picked up again by another worker once their lease expires
+        await app.state.job_worker.stop(wait=False)
+    await risk_batcher.close()
+    inference_executor.shutdown()
+    shutdown_ocr_pool()
+    shutdown_report_pools()
+    await ocr_writer.stop()
+    await close_openai_client()
 
 @app.post("/api/predict-risk")
-async def predict_risk(metrics: HealthMetrics):
-    result = await risk_predictor.predict_risk(metrics)
-    return result
+async def predict_risk(health_metrics: HealthMetrics, request: Request, user_id: Optional[str] = None):
+    # Everything between the middleware and here is body parsing and pydantic validation
+    received_at = getattr(request.state, "received_at", None)
+    if received_at is not None:
+        metrics.observe_stage("http.parse_validate", time.perf_counter() - received_at)
+
+    key = metrics_cache_key(health_metrics)
+    # Sticky per input, so a repeated request stays on the same side of an A/B split
+    version = model_versions.choose(key)
+    result = prediction_cache.get(versioned_key(version, key))
+    if result is None:
+        try:
+            with metrics.stage("risk.inference"):
+                if RISK_BATCHING:
+                    result = await risk_batcher.submit((health_metrics, version))
+                else:
+                    result = await inference_executor.predict(health_metrics, version)
+        except QueueFullError:
+            raise queue_full_error()
+        prediction_cache.set(versioned_key(result['model_version'], key), result)
+
+    if user_id:
+        try:
+            await asyncio.to_thread(timeseries_store.record, user_id, health_metrics, result)
+        except Exception as e:
+            # The prediction is still valid, it just won't show up in the user's history
+            logger.error(f"Failed to record risk history for {user_id}: {str(e)}")
+
+    with metrics.stage("http.serialize"):
+        return JSONResponse(content=result)
+
+@app.post("/api/predict-risk/batch")
+async def predict_risk_batch(batch: List[HealthMetrics]):
+    if len(batch) > RISK_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {RISK_BATCH_MAX_ITEMS} items per batch")
+    keys = [metrics_cache_key(m) for m in batch]
+    versions = [model_versions.choose(key) for key in keys]
+    results = [prediction_cache.get(versioned_key(v, key)) for v, key in zip(versions, keys)]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        try:
+            scored = await inference_executor.predict_versioned([(batch[i], versions[i]) for i in missing])
+        except QueueFullError:
+            raise queue_full_error()
+        for i, result in zip(missing, scored):
+            results[i] = result
+            prediction_cache.set(versioned_key(result['model_version'], keys[i]), result)
+    return {"results": results}
+
+@app.get("/api/predict-risk/history/{user_id}")
+async def predict_risk_history(user_id: str, limit: int = 100, since: Optional[datetime] = None):
+    """Recorded metrics and risk scores, oldest first; nothing is re-scored."""
+    since_ts = since.timestamp() if since is not None else None
+    return await asyncio.to_thread(timeseries_store.history, user_id, limit, since_ts)
+
+@app.get("/api/predict-risk/trends/{user_id}")
+async def predict_risk_trends(user_id: str):
+    trends = await asyncio.to_thread(timeseries_store.trends, user_id)
+    if trends is None:
+        raise HTTPException(status_code=404, detail="No risk history for this user")
+    return trends
+
+@app.get("/api/predict-risk/stats")
+async def predict_risk_stats():
+    return {
+        "executor": inference_executor.stats(),
+        "batching": risk_batcher.stats() if RISK_BATCHING else None,
+        "cache": prediction_cache.stats()
+    }
+
+@app.get("/api/ocr/history/{user_id}")
+async def ocr_history(user_id: str, limit: int = 50):
+    return {"results": await get_history(user_id, limit), "writer": ocr_writer.stats()}
+
+@app.get("/api/ocr/cache/stats")
+async def ocr_cache_stats():
+    return await asyncio.to_thread(ocr_cache.stats)
+
+@app.post("/api/summarize")
+async def summarize(text_input: SummaryInput):
+    try:
+        return await generate_summary(text_input)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/summarize/stream")
+async def summarize_stream(text_input: SummaryInput):
+    if text_input.mode not in ("quality", "fast"):
+        raise HTTPException(status_code=400, detail=f"Unknown summarization mode: {text_input.mode}")
+    return StreamingResponse(stream_summary(text_input), media_type="text/plain; charset=utf-8")
+
+@app.post("/api/ocr")
+async def ocr(file: UploadFile = File(...), user_id: Optional[str] = Form(None)):
+    return {"text": await process_image(file, user_id)}
+
+@app.post("/api/ocr/document")
+async def ocr_document(files: List[UploadFile] = File(...), user_id: Optional[str] = Form(None)):
+    """Stream one JSON line per page as soon as that page is OCR'd."""
+    async def pages():
+        async for page in process_document(files, user_id):
+            yield json.dumps(page) + "\n"
+    return StreamingResponse(pages(), media_type="application/x-ndjson")
+
+@app.post("/api/analyze-medical-report")
+async def analyze_medical_report(request: Request, mode: str = "quality"):
+    """OCR, NER and summarize a report, streaming one JSON line per page per stage.
+
+    Accepts multipart uploads (`files`, optional `user_id`) or JSON {"text": ...}
+    for text that was already extracted, which skips OCR. The last line has
+    per-stage timings.
+    """
+    if mode not in ("quality", "fast"):
+        raise HTTPException(status_code=400, detail=f"Unknown summarization mode: {mode}")
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        files = form.getlist("files") or form.getlist("file")
+        if not files:
+            raise HTTPException(status_code=400, detail="No files uploaded")
+        events = analyze_document(await document_jobs(files), form.get("user_id"), mode)
+    else:
+        try:
+            text = (await request.json())["text"]
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail='Expected multipart files or JSON {"text": ...}')
+        events = analyze_text(text, mode)
+
+    async def lines():
+        async for event in events:
+            yield json.dumps(event) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+async def queue_job(kind: str, payload: dict, priority: str) -> JSONResponse:
+    try:
+        job, created = await asyncio.to_thread(submit_job, kind, payload, priority)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(status_code=202, content={**job, "deduplicated": not created})
+
+@app.post("/api/jobs")
+async def create_job(job_request: JobRequest):
+    """Queue a job ("summarize", "ner" or "analyze_report"); identical inputs share one job."""
+    return await queue_job(job_request.kind, job_request.payload, job_request.priority)
+
+@app.post("/api/jobs/analyze-report")
+async def create_report_job(files: List[UploadFile] = File(...), user_id: Optional[str] = Form(None),
+                            mode: str = Form("quality"), priority: str = Form("interactive")):
+    """Background version of /api/analyze-medical-report for uploaded files."""
+    payload = {
+        "files": [
+            {"filename": file.filename, "content_base64": base64.b64encode(await file.read()).decode()}
+            for file in files
+        ],
+        "mode": mode,
+        "user_id": user_id
+    }
+    return await queue_job("analyze_report", payload, priority)
+
+@app.get("/api/jobs/stats")
+async def job_stats():
+    worker = app.state.job_worker
+    return {
+        **await asyncio.to_thread(get_broker().stats),
+        "inprocess_worker": worker.stats() if worker is not None else None
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(get_broker().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-sent events: a `status` event whenever the job changes, then `done` with the result."""
+    broker = get_broker()
+    job = await asyncio.to_thread(broker.get, job_id, False)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last_update = None
+        while not await request.is_disconnected():
+            job = await asyncio.to_thread(broker.get, job_id, False)
+            if job is None:
+                yield sse_event({"detail": "Job not found"}, event="error")
+                return
+            if job["status"] in FINISHED:
+                yield sse_event(await asyncio.to_thread(broker.get, job_id), event="done")
+                return
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                yield sse_event(job, event="status")
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/chat")
+async def chat(chat_input: ChatInput):
+    return await chatbot.get_response(chat_input)
+
+@app.get("/api/chat/cache/stats")
+async def chat_cache_stats():
+    return semantic_cache.stats()
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream(chat_input: ChatInput, request: Request):
+    """Server-sent events: one `data: {"delta": ...}` per chunk, then a `done` event."""
+    async def events():
+        deltas = chatbot.stream_response(chat_input)
+        try:
+            async for delta in deltas:
+                if await request.is_disconnected():
+                    break
+                yield sse_event({"delta": delta})
+            else:
+                yield sse_event({}, event="done")
+        except Exception as e:
+            logger.error(f"Chat stream failed: {str(e)}")
+            detail = e.detail if isinstance(e, HTTPException) else "Failed to generate response"
+            yield sse_event({"detail": detail}, event="error")
+        finally:
+            # Closing the generator closes the upstream OpenAI stream
+            await deltas.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def admin_profile(seconds: float = 10, mode: str = "cpu", format: str = "collapsed",
+                        interval_ms: float = 10, top: int = 25, include_idle: bool = False):
+    """Profile the live process for `seconds`.
+
+    mode=cpu samples every thread's stack; format=collapsed returns a file for
+    flamegraph.pl/speedscope, format=json a per-route and top-frame summary.
+    mode=memory diffs tracemalloc snapshots and reports ai_services allocations.
+    """
+    if not 0 < seconds <= profiler.MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {profiler.MAX_PROFILE_SECONDS}]")
+    if mode not in ("cpu", "memory") or format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="mode must be cpu|memory and format collapsed|json")
+    if interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms must be at least 1")
+    if profiler.profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    async with profiler.profile_lock:
+        if mode == "memory":
+            return await profiler.profile_allocations(seconds, top)
+        result, elapsed = await profiler.profile_cpu(seconds, interval_ms / 1000, include_idle)
+
+    if format == "json":
+        return result.summary(round(elapsed, 3), top)
+    return PlainTextResponse(
+        result.collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{int(time.time())}.collapsed"'}
+    )
+
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+async def admin_models():
+    return model_versions.status()
+
+@app.post("/admin/models/activate", dependencies=[Depends(require_admin)])
+async def admin_activate_model(version: str):
+    """Load (if needed), warm and switch all default traffic to `version`."""
+    if version not in model_versions.available():
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {version}")
+    try:
+        await asyncio.to_thread(model_versions.activate, version)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load {version}: {str(e)}")
+    return model_versions.status()
+
+@app.post("/admin/models/ab", dependencies=[Depends(require_admin)])
+async def admin_ab_split(version: Optional[str] = None, split: float = 0.0):
+    """Send `split` of traffic to `version`; no version (or split=0) turns the test off."""
+    if version is not None and version not in model_versions.available():
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {version}")
+    try:
+        await asyncio.to_thread(model_versions.set_ab, version, split)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load {version}: {str(e)}")
+    return model_versions.status()
+
+async def model_status() -> Dict:
+    client = get_model_client()
+    if client is None:
+        return registry.status()
+    return await asyncio.to_thread(client.call, "registry.status")
+
+@app.get("/ready")
+async def ready():
+    try:
+        models = await model_status()
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"ready": False, "error": f"Model server unavailable: {str(e)}"})
+    required = models if WARM_MODELS == ['all'] else {m: models.get(m, {'loaded': False}) for m in WARM_MODELS}
+    is_ready = inference_executor.warmed and all(m['loaded'] for m in required.values())
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "executor": inference_executor.stats(), "models": models}
+    )
 
 @app.get("/")
 async def root():
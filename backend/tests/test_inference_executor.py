@@ -0,0 +1,85 @@
+"""503 backpressure accounting of the inference pool, with a stand-in for the models."""
+import asyncio
+import threading
+import pytest
+from ai_services import inference_executor
+from ai_services.inference_executor import InferenceExecutor, QueueFullError
+
+@pytest.fixture
+def gate(monkeypatch):
+    """Every scoring call blocks until the test sets the returned event."""
+    release = threading.Event()
+
+    def score(metrics_list, version):
+        release.wait(5)
+        return [{"model_version": version} for _ in metrics_list]
+
+    monkeypatch.setattr(inference_executor, '_init_thread_worker', lambda: None)
+    monkeypatch.setattr(inference_executor, '_score_in_thread', score)
+    yield release
+    release.set()
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def settle():
+    # Let submitted futures reach the pool and done callbacks run
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+def test_pending_counts_predictions_not_batches(gate):
+    executor = InferenceExecutor(mode='thread', workers=1, queue_size=2)
+
+    async def scenario():
+        first = asyncio.create_task(executor.predict_batch([object()] * 2))
+        second = asyncio.create_task(executor.predict_batch([object()]))
+        await settle()
+        assert executor.pending == 3 == executor.capacity
+        with pytest.raises(QueueFullError):
+            await executor.predict_batch([object()])
+        gate.set()
+        assert len(await first) == 2 and len(await second) == 1
+        await settle()
+        assert executor.pending == 0
+
+    try:
+        run(scenario())
+    finally:
+        executor.shutdown()
+
+def test_oversized_batch_runs_when_nothing_is_pending(gate):
+    executor = InferenceExecutor(mode='thread', workers=1, queue_size=2)
+
+    async def scenario():
+        gate.set()
+        results = await executor.predict_batch([object()] * 10)
+        assert len(results) == 10
+        await settle()
+        assert executor.pending == 0
+
+    try:
+        run(scenario())
+    finally:
+        executor.shutdown()
+
+def test_cancelled_caller_keeps_its_slot_until_the_worker_finishes(gate):
+    executor = InferenceExecutor(mode='thread', workers=1, queue_size=4)
+
+    async def scenario():
+        waiter = asyncio.create_task(executor.predict_batch([object()] * 3))
+        await settle()
+        waiter.cancel()
+        await settle()
+        # The worker is still busy with those predictions
+        assert executor.pending == 3
+        gate.set()
+        for _ in range(100):
+            if executor.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert executor.pending == 0
+
+    try:
+        run(scenario())
+    finally:
+        executor.shutdown()
@@ -0,0 +1,117 @@
+"""Lease, retry, dedup and ordering rules every job broker must follow."""
+import pytest
+from ai_services import job_broker
+from ai_services.job_broker import FAILED, QUEUED, RUNNING, SUCCEEDED, Broker, MemoryBroker, SQLiteBroker
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def broker(request, tmp_path) -> Broker:
+    if request.param == 'sqlite':
+        return SQLiteBroker(str(tmp_path / 'jobs.db'))
+    return MemoryBroker()
+
+def test_partial_broker_fails_when_created():
+    class Partial(Broker):
+        def submit(self, kind, payload, priority, dedup_key=None, max_attempts=3):
+            return {}, True
+
+    with pytest.raises(TypeError):
+        Partial()
+
+def test_claims_by_priority_then_age(broker):
+    batch, _ = broker.submit("ner", {"n": 1}, 10)
+    older, _ = broker.submit("ner", {"n": 2}, 0)
+    newer, _ = broker.submit("ner", {"n": 3}, 0)
+    claimed = [broker.claim("w")[0]["id"] for _ in range(3)]
+    assert claimed == [older["id"], newer["id"], batch["id"]]
+    assert broker.claim("w") is None
+
+def test_claim_filters_kinds_and_returns_payload(broker):
+    broker.submit("summarize", {"text": "a"}, 0)
+    broker.submit("ner", {"texts": ["b"]}, 0)
+    job, payload = broker.claim("w", kinds=["ner"])
+    assert (job["kind"], payload, job["status"], job["attempts"]) == ("ner", {"texts": ["b"]}, RUNNING, 1)
+    assert "payload" not in job
+
+def test_only_the_lease_holder_can_update(broker):
+    job, _ = broker.submit("ner", {}, 0)
+    broker.claim("owner")
+    assert not broker.renew(job["id"], "other")
+    assert not broker.complete(job["id"], "other", "result")
+    assert not broker.fail(job["id"], "other", "error", 0)
+    assert broker.renew(job["id"], "owner", progress={"page": 1})
+    assert broker.get(job["id"])["progress"] == {"page": 1}
+    assert broker.complete(job["id"], "owner", {"pages": 1})
+    done = broker.get(job["id"])
+    assert (done["status"], done["result"]) == (SUCCEEDED, {"pages": 1})
+    assert "result" not in broker.get(job["id"], include_result=False)
+
+def test_expired_lease_is_claimed_again_as_the_next_attempt(broker):
+    job, _ = broker.submit("ner", {}, 0, max_attempts=2)
+    broker.claim("dead", lease_seconds=-1)
+    reclaimed, _ = broker.claim("alive")
+    assert (reclaimed["id"], reclaimed["worker"], reclaimed["attempts"]) == (job["id"], "alive", 2)
+    # The first worker lost the job and can no longer finish it
+    assert not broker.complete(job["id"], "dead", "late")
+
+def test_expired_lease_on_the_last_attempt_fails_the_job(broker):
+    job, _ = broker.submit("ner", {}, 0, max_attempts=1)
+    broker.claim("dead", lease_seconds=-1)
+    assert broker.claim("alive") is None
+    lost = broker.get(job["id"])
+    assert (lost["status"], lost["error"]) == (FAILED, "worker lost")
+
+def test_failed_attempt_is_retried_after_the_delay(broker):
+    job, _ = broker.submit("ner", {}, 0, max_attempts=2)
+    broker.claim("w")
+    assert broker.fail(job["id"], "w", "transient", 60)
+    queued = broker.get(job["id"])
+    assert (queued["status"], queued["error"]) == (QUEUED, "transient")
+    assert broker.claim("w") is None  # not due yet
+
+def test_retries_stop_at_max_attempts(broker):
+    job, _ = broker.submit("ner", {}, 0, max_attempts=2)
+    broker.claim("w")
+    broker.fail(job["id"], "w", "first", 0)
+    retried, _ = broker.claim("w")
+    assert retried["attempts"] == 2
+    broker.fail(job["id"], "w", "second", 0)
+    assert broker.get(job["id"])["status"] == FAILED
+    assert broker.claim("w") is None
+
+def test_permanent_failure_is_not_retried(broker):
+    job, _ = broker.submit("ner", {}, 0, max_attempts=3)
+    broker.claim("w")
+    broker.fail(job["id"], "w", "bad input", None)
+    assert broker.get(job["id"])["status"] == FAILED
+
+def test_dedup_returns_queued_running_and_recent_jobs(broker):
+    job, created = broker.submit("ner", {"n": 1}, 0, dedup_key="k")
+    assert created
+    assert broker.submit("ner", {"n": 1}, 0, dedup_key="k") == (broker.get(job["id"], False), False)
+    broker.claim("w")
+    assert broker.submit("ner", {"n": 1}, 0, dedup_key="k")[0]["id"] == job["id"]
+    broker.complete(job["id"], "w", "done")
+    assert broker.submit("ner", {"n": 1}, 0, dedup_key="k")[0]["id"] == job["id"]
+
+def test_dedup_skips_failed_and_stale_jobs(broker, monkeypatch):
+    failed, _ = broker.submit("ner", {}, 0, dedup_key="f", max_attempts=1)
+    broker.claim("w")
+    broker.fail(failed["id"], "w", "error", None)
+    assert broker.submit("ner", {}, 0, dedup_key="f")[1]
+
+    done, _ = broker.submit("summarize", {}, 0, dedup_key="d")
+    broker.claim("w", kinds=["summarize"])
+    broker.complete(done["id"], "w", "result")
+    monkeypatch.setattr(job_broker, 'JOB_DEDUP_SECONDS', -1)
+    assert broker.submit("summarize", {}, 0, dedup_key="d")[1]
+
+def test_purge_removes_only_old_finished_jobs(broker):
+    done, _ = broker.submit("ner", {}, 0)
+    broker.claim("w")
+    broker.complete(done["id"], "w", "result")
+    waiting, _ = broker.submit("ner", {"n": 2}, 0)
+    assert broker.purge(older_than=3600) == 0
+    assert broker.purge(older_than=-1) == 1
+    assert broker.get(done["id"]) is None
+    assert broker.get(waiting["id"])["status"] == QUEUED
+    assert broker.stats()["jobs"] == {"ner": {QUEUED: 1}}
@@ -0,0 +1,77 @@
+"""TTLCache expiry and LRU eviction, and the quantized metrics cache key."""
+import pytest
+from ai_services import cache
+from ai_services.cache import TTLCache
+from ai_services.risk_prediction_service import HealthMetrics, metrics_cache_key
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'monotonic', clock)
+    return clock
+
+def metrics(**overrides) -> HealthMetrics:
+    values = dict(age=50, gender='male', height=175.0, weight=80.0, blood_pressure_systolic=130.0,
+                  blood_pressure_diastolic=85.0, heart_rate=70.0, blood_sugar=95.0, cholesterol=200.0,
+                  smoking=False, alcohol_consumption=3.0, physical_activity_hours=4.0)
+    values.update(overrides)
+    return HealthMetrics(**values)
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache(maxsize=10, ttl=60)
+    c.set('a', 1)
+    clock.now += 59
+    assert c.get('a') == 1
+    clock.now += 2
+    assert c.get('a') is None
+    assert len(c) == 0
+    assert (c.hits, c.misses) == (1, 1)
+
+def test_no_ttl_never_expires(clock):
+    c = TTLCache(maxsize=10, ttl=None)
+    c.set('a', 1)
+    clock.now += 10 ** 9
+    assert c.get('a') == 1
+
+def test_evicts_least_recently_used(clock):
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set('a', 1)
+    c.set('b', 2)
+    assert c.get('a') == 1  # 'b' is now the oldest
+    c.set('c', 3)
+    assert c.get('b', 'gone') == 'gone'
+    assert c.get('a') == 1 and c.get('c') == 3
+    assert c.evictions == 1
+
+def test_set_refreshes_expiry(clock):
+    c = TTLCache(maxsize=10, ttl=60)
+    c.set('a', 1)
+    clock.now += 50
+    c.set('a', 2)
+    clock.now += 50
+    assert c.get('a') == 2
+
+def test_key_ignores_gender_case():
+    assert metrics_cache_key(metrics(gender='Male'), {}) == metrics_cache_key(metrics(gender='male'), {})
+
+def test_key_is_exact_without_quantization():
+    assert metrics_cache_key(metrics(weight=80.0), {}) != metrics_cache_key(metrics(weight=80.01), {})
+
+def test_quantization_rounds_to_the_nearest_step():
+    steps = {'weight': 0.5, 'blood_sugar': 5}
+    key = metrics_cache_key(metrics(weight=80.0, blood_sugar=95), steps)
+    assert metrics_cache_key(metrics(weight=80.2, blood_sugar=97), steps) == key
+    assert metrics_cache_key(metrics(weight=79.8, blood_sugar=93), steps) == key
+    assert metrics_cache_key(metrics(weight=80.3, blood_sugar=95), steps) != key
+    assert metrics_cache_key(metrics(weight=80.0, blood_sugar=98), steps) != key
+
+def test_quantization_only_touches_listed_fields():
+    steps = {'weight': 0.5}
+    assert metrics_cache_key(metrics(height=175.0), steps) != metrics_cache_key(metrics(height=175.1), steps)
@@ -0,0 +1,49 @@
+"""The compiled rule table must match the if-chain it replaced, rule for rule."""
+import json
+import random
+import numpy as np
+import pytest
+from ai_services.risk_prediction_service import HealthMetrics, recommendation_rules
+from benchmarks.bench_recommendation_rules import compiled, legacy
+from benchmarks.fixtures import random_metrics
+
+def metrics(**overrides) -> HealthMetrics:
+    values = dict(age=50, gender='female', height=165.0, weight=65.0, blood_pressure_systolic=120.0,
+                  blood_pressure_diastolic=80.0, heart_rate=70.0, blood_sugar=90.0, cholesterol=190.0,
+                  smoking=False, alcohol_consumption=2.0, physical_activity_hours=5.0)
+    values.update(overrides)
+    return HealthMetrics(**values)
+
+# Values on and either side of every threshold in the old if-chain
+BOUNDARIES = [
+    metrics(),
+    metrics(physical_activity_hours=3), metrics(physical_activity_hours=2.99),
+    metrics(blood_pressure_systolic=140), metrics(blood_pressure_systolic=140.01),
+    metrics(blood_pressure_diastolic=90), metrics(blood_pressure_diastolic=90.01),
+    metrics(blood_sugar=100), metrics(blood_sugar=100.01),
+    metrics(physical_activity_hours=0, blood_pressure_systolic=180, blood_pressure_diastolic=110, blood_sugar=200),
+]
+
+@pytest.mark.parametrize('sample', BOUNDARIES)
+def test_matches_if_chain_at_thresholds(sample):
+    assert json.dumps(compiled(sample)) == json.dumps(legacy(sample))
+
+def test_matches_if_chain_on_random_metrics():
+    rng = random.Random(0)
+    for _ in range(500):
+        sample = random_metrics(rng)
+        assert json.dumps(compiled(sample)) == json.dumps(legacy(sample)), sample
+
+def test_match_matrix_agrees_with_matching_rules():
+    rng = random.Random(1)
+    samples = [random_metrics(rng) for _ in range(200)] + BOUNDARIES
+    columns = {field: np.array([getattr(s, field) for s in samples]) for field in recommendation_rules.fields}
+    matrix = recommendation_rules.match_matrix(columns)
+    for row, sample in zip(matrix, samples):
+        matched = {rule.id for rule in recommendation_rules.matching_rules(sample)}
+        assert [rule.id in matched for rule in recommendation_rules.rules] == row.tolist()
+
+def test_payloads_are_read_only():
+    payload = recommendation_rules.evaluate(metrics(blood_sugar=150))[0]
+    with pytest.raises(TypeError):
+        payload['title'] = 'changed'
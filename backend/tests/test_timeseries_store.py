@@ -0,0 +1,97 @@
+"""Incremental trend math of the time-series store against a direct recomputation."""
+import random
+import numpy as np
+import pytest
+from ai_services.risk_prediction_service import HealthMetrics, RISK_CATEGORIES
+from ai_services.timeseries_store import (SECONDS_PER_DAY, SERIES, TREND_EWMA_ALPHA, TREND_WINDOWS,
+                                          TimeSeriesStore, _Window, _row)
+
+START = 1_700_000_000.0
+
+def sample(rng: random.Random):
+    metrics = HealthMetrics(
+        age=50, gender=rng.choice(['male', 'female']), height=170.0, weight=rng.uniform(60, 100),
+        blood_pressure_systolic=rng.uniform(100, 170), blood_pressure_diastolic=rng.uniform(60, 100),
+        heart_rate=rng.uniform(55, 100), blood_sugar=rng.uniform(70, 180), cholesterol=rng.uniform(150, 280),
+        smoking=rng.random() < 0.3, alcohol_consumption=rng.uniform(0, 10), physical_activity_hours=rng.uniform(0, 8))
+    result = {"health_score": rng.randint(0, 100),
+              "risk_scores": {name: rng.randint(0, 100) for name in RISK_CATEGORIES}}
+    return metrics, result
+
+@pytest.fixture
+def recorded(tmp_path):
+    """A store holding 30 irregularly spaced points for one user, and the rows as stored (float32)."""
+    rng = random.Random(0)
+    store = TimeSeriesStore(root=str(tmp_path))
+    timestamps, rows = [], []
+    for i in range(30):
+        timestamp = START + i * SECONDS_PER_DAY + rng.uniform(0, 3600)
+        metrics, result = sample(rng)
+        store.record("user", metrics, result, timestamp)
+        timestamps.append(timestamp)
+        rows.append(_row(metrics, result).astype(np.float32).astype(np.float64))
+    return store, np.array(timestamps), np.array(rows)
+
+def expected_slopes(timestamps: np.ndarray, rows: np.ndarray, size: int) -> np.ndarray:
+    x = (timestamps - timestamps[0]) / SECONDS_PER_DAY
+    return np.polyfit(x[-size:], rows[-size:], 1)[0]
+
+def test_window_slides_like_a_fresh_fit():
+    rng = np.random.default_rng(0)
+    window, kept = _Window(5, 3), []
+    for x in np.cumsum(rng.uniform(0.5, 2, 40)):
+        y = rng.normal(size=3)
+        if window.n == window.size:
+            window.add(*kept[-window.size], -1)
+        window.add(x, y)
+        kept.append((x, y))
+        if len(kept) >= 2:
+            xs = np.array([p[0] for p in kept[-5:]])
+            ys = np.array([p[1] for p in kept[-5:]])
+            np.testing.assert_allclose(window.slopes(), np.polyfit(xs, ys, 1)[0], rtol=1e-6, atol=1e-9)
+
+def test_window_needs_two_distinct_times():
+    window = _Window(5, 1)
+    assert window.slopes() is None
+    window.add(1.0, np.array([2.0]))
+    window.add(1.0, np.array([3.0]))
+    assert window.slopes() is None
+
+def test_trends_match_recomputation(recorded):
+    store, timestamps, rows = recorded
+    trends = store.trends("user")
+    assert trends["points"] == len(rows)
+
+    ewma = rows[0].copy()
+    for row in rows[1:]:
+        ewma += TREND_EWMA_ALPHA * (row - ewma)
+    slopes = {size: expected_slopes(timestamps, rows, size) for size in TREND_WINDOWS}
+    for i, name in enumerate(SERIES):
+        series = trends["series"][name]
+        assert series["latest"] == pytest.approx(rows[-1, i], abs=1e-4)
+        assert series["delta"] == pytest.approx(rows[-1, i] - rows[-2, i], abs=1e-4)
+        assert series["ewma"] == pytest.approx(ewma[i], abs=1e-4)
+        assert series["min"] == pytest.approx(rows[:, i].min(), abs=1e-4)
+        assert series["max"] == pytest.approx(rows[:, i].max(), abs=1e-4)
+        for size in TREND_WINDOWS:
+            assert series["slope_per_day"][str(size)] == pytest.approx(slopes[size][i], abs=1e-3)
+
+def test_rebuild_from_disk_gives_the_same_trends(recorded, tmp_path):
+    store, _, _ = recorded
+    assert TimeSeriesStore(root=str(tmp_path)).trends("user") == store.trends("user")
+
+def test_history_limit_and_since(recorded):
+    store, timestamps, rows = recorded
+    history = store.history("user", limit=10)
+    assert history["points"] == 10
+    assert history["health_score"] == rows[-10:, SERIES.index('health_score')].astype(int).tolist()
+    since = store.history("user", limit=100, since=timestamps[25])
+    assert since["points"] == 5
+
+def test_timestamps_never_go_backwards(tmp_path):
+    rng = random.Random(1)
+    store = TimeSeriesStore(root=str(tmp_path))
+    store.record("user", *sample(rng), timestamp=START + 100)
+    store.record("user", *sample(rng), timestamp=START)
+    assert store.trends("user")["last"] == store.trends("user")["first"]
+    assert store.trends("nobody") is None
@@ -17,11 +17,54 @@ import { UploadFile, Analytics } from '@mui/icons-material';
 import Tesseract from 'tesseract.js';
 
 interface AnalysisResult {
-  type: 'condition' | 'medication' | 'measurement' | 'recommendation';
+  type: 'condition' | 'medication' | 'measurement' | 'recommendation' | 'summary';
   value: string;
-  confidence: number;
+  confidence?: number;
 }
 
+interface ReportEntity {
+  text: string;
+  label: string;
+}
+
+// One JSON line per page per stage from /api/analyze-medical-report, then a "done" line
+interface ReportEvent {
+  stage: 'ocr' | 'ner' | 'summary' | 'done';
+  error?: string;
+  entities?: {
+    scispacy_entities: ReportEntity[];
+    biobert_entities: ReportEntity[];
+  };
+  summary?: string;
+}
+
+const entityType = (entity: ReportEntity): AnalysisResult['type'] => {
+  if (/chem|drug|medic/i.test(entity.label)) return 'medication';
+  if (/\d/.test(entity.text)) return 'measurement';
+  return 'condition';
+};
+
+// Confidence is the share of the two NER models (SciSpacy, BioBERT) that found the entity
+const entityResults = (entities: NonNullable<ReportEvent['entities']>): AnalysisResult[] => {
+  const found = new Map<string, { entity: ReportEntity; models: number }>();
+  for (const list of [entities.scispacy_entities, entities.biobert_entities]) {
+    const seen = new Set<string>();
+    for (const entity of list) {
+      const key = entity.text.trim().toLowerCase();
+      if (!key || seen.has(key)) continue;
+      seen.add(key);
+      const entry = found.get(key);
+      if (entry) entry.models += 1;
+      else found.set(key, { entity, models: 1 });
+    }
+  }
+  return Array.from(found.values()).map(({ entity, models }) => ({
+    type: entityType(entity),
+    value: entity.text.trim(),
+    confidence: models / 2,
+  }));
+};
+
 export const MedicalReportScanner: React.FC = () => {
   const [isProcessing, setIsProcessing] = useState(false);
   const [progress, setProgress] = useState(0);
@@ -48,9 +91,9 @@ export const MedicalReportScanner: React.FC = () => {
         },
       });
 
-      // Process the extracted text with NLP
-      const analysisResults = await analyzeText(result.data.text);
-      setResults(analysisResults);
+      // Process the extracted text with NLP, showing results as each stage finishes
+      setResults([]);
+      await analyzeText(result.data.text, (items) => setResults((prev) => [...prev, ...items]));
     } catch (err) {
       console.error('Error processing medical report:', err);
       setError('Failed to process the medical report. Please try again.');
@@ -59,22 +102,51 @@ export const MedicalReportScanner: React.FC = () => {
     }
   }, []);
 
-  const analyzeText = async (text: string): Promise<AnalysisResult[]> => {
+  const analyzeText = async (text: string, onResults: (items: AnalysisResult[]) => void): Promise<void> => {
     try {
       const response = await fetch('/api/analyze-medical-report', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          Accept: 'application/x-ndjson',
         },
         body: JSON.stringify({ text }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error('Failed to analyze the report');
       }
 
-      const data = await response.json();
-      return data.results;
+      // Parse newline-delimited JSON events as they arrive
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let finished = false;
+      while (!finished) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const event: ReportEvent = JSON.parse(line);
+          if (event.stage === 'done') {
+            if (event.error) throw new Error(event.error);
+            finished = true;
+          } else if (event.error) {
+            // One stage failed; keep whatever the other stages found
+            setError(`Part of the analysis failed (${event.stage}): ${event.error}`);
+          } else if (event.stage === 'ner' && event.entities) {
+            onResults(entityResults(event.entities));
+          } else if (event.stage === 'summary' && event.summary) {
+            onResults([{ type: 'summary', value: event.summary }]);
+          }
+        }
+      }
+      if (!finished) {
+        throw new Error('The analysis ended before it was complete');
+      }
     } catch (err) {
       console.error('Error analyzing text:', err);
       throw err;
@@ -102,6 +174,8 @@ export const MedicalReportScanner: React.FC = () => {
         return 'info';
       case 'recommendation':
         return 'success';
+      case 'summary':
+        return 'secondary';
       default:
         return 'default';
     }
@@ -197,7 +271,11 @@ export const MedicalReportScanner: React.FC = () => {
                         <Typography variant="body1">{result.value}</Typography>
                       </Box>
                     }
-                    secondary={`Confidence: ${(result.confidence * 100).toFixed(1)}%`}
+                    secondary={
+                      result.confidence !== undefined
+                        ? `Confidence: ${(result.confidence * 100).toFixed(1)}%`
+                        : undefined
+                    }
                   />
                 </ListItem>
               ))}
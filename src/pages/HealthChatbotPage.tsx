@@ -49,15 +49,31 @@ export const HealthChatbotPage: React.FC = () => {
     setInput('');
     setLoading(true);
 
+    // Placeholder that fills in as the reply streams
+    const botMessage: Message = {
+      text: '',
+      sender: 'bot',
+      timestamp: new Date(),
+    };
+    const appendToBotMessage = (delta: string) => {
+      setMessages((prev) => {
+        const next = [...prev];
+        const last = next[next.length - 1];
+        next[next.length - 1] = { ...last, text: last.text + delta };
+        return next;
+      });
+    };
+
     try {
-      const response = await fetch('http://localhost:8000/api/chat', {
+      const response = await fetch('http://localhost:8000/api/chat/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          Accept: 'text/event-stream',
         },
         body: JSON.stringify({
           messages: messages.concat(userMessage).map(msg => ({
-            role: msg.sender,
+            role: msg.sender === 'bot' ? 'assistant' : 'user',
             content: msg.text
           })),
           user_data: healthProfile ? {
@@ -73,23 +89,45 @@ export const HealthChatbotPage: React.FC = () => {
         }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         const errorData = await response.json().catch(() => ({}));
         throw new Error(errorData.detail || 'Failed to get response from chatbot');
       }
 
-      const data = await response.json();
-      if (!data.response) {
+      setMessages((prev) => [...prev, botMessage]);
+      setLoading(false);
+
+      // Parse server-sent events: blank-line separated blocks of "event:" / "data:" lines
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let received = false;
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+        for (const block of events) {
+          let event = 'message';
+          let data = '';
+          for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) data += line.slice(5).trim();
+          }
+          const payload = data ? JSON.parse(data) : {};
+          if (event === 'error') {
+            throw new Error(payload.detail || 'Failed to get response from chatbot');
+          }
+          if (payload.delta) {
+            received = true;
+            appendToBotMessage(payload.delta);
+          }
+        }
+      }
+      if (!received) {
         throw new Error('Invalid response format from server');
       }
-
-      const botMessage: Message = {
-        text: data.response,
-        sender: 'bot',
-        timestamp: new Date(),
-      };
-
-      setMessages((prev) => [...prev, botMessage]);
     } catch (error) {
       console.error('Error:', error);
       const errorMessage: Message = {
@@ -97,7 +135,11 @@ export const HealthChatbotPage: React.FC = () => {
         sender: 'bot',
         timestamp: new Date(),
       };
-      setMessages((prev) => [...prev, errorMessage]);
+      setMessages((prev) => [
+        // Drop the placeholder if nothing streamed into it
+        ...prev.filter((msg) => msg.timestamp !== botMessage.timestamp || msg.text),
+        errorMessage,
+      ]);
     } finally {
       setLoading(false);
     }